@@ -0,0 +1,208 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import User
+
+CACHE_PREFIX = 'api_response'
+VERSION_PREFIX = f'{CACHE_PREFIX}:version'
+STATS_PREFIX = f'{CACHE_PREFIX}:stats'
+HIT = 'hit'
+MISS = 'miss'
+
+# Модели, от которых зависит ответ RecipeSerializer.
+RECIPE_MODELS = (Recipe, IngredientRecipe, Ingredient, Tag, User)
+# Связи, от которых зависят счетчики рецептов, а значит и порядок
+# списка при сортировке по favorites_count и carts_count.
+COUNTER_MODELS = (Favorite, ShoppingCart)
+
+
+def version_key(model):
+    return f'{VERSION_PREFIX}:{model._meta.label_lower}'
+
+
+def initial_version():
+    """
+    Начальное значение версии берется от времени, чтобы после
+    вытеснения счетчика из кэша не совпасть со старыми ключами.
+    """
+    return int(time.time() * 1000)
+
+
+def get_or_init_many(defaults):
+    """
+    Читает ключи одним запросом к кэшу, отсутствующие
+    инициализирует значениями из defaults.
+    """
+    values = cache.get_many(list(defaults))
+    for key, default in defaults.items():
+        if key not in values:
+            cache.add(key, default, None)
+            values[key] = cache.get(key, default)
+    return values
+
+
+def get_versions(models):
+    keys = [version_key(model) for model in models]
+    versions = get_or_init_many(dict.fromkeys(keys, initial_version()))
+    return [versions[key] for key in keys]
+
+
+def get_catalog_stamp(model):
+    """
+    Штамп справочника из самой таблицы: число строк, наибольший id
+    и последнее время изменения. Меняется при любой записи,
+    включая bulk_create и записи из других процессов, в отличие
+    от счетчиков версий в кэше процесса.
+    Возвращает (части штампа, время изменения в секундах).
+    """
+    stamp = model.objects.aggregate(
+        count=Count('pk'), last_id=Max('pk'), modified=Max('updated_at')
+    )
+    modified = stamp['modified']
+    return (
+        (stamp['count'], stamp['last_id'], modified),
+        modified.timestamp() if modified else 0
+    )
+
+
+def bump_version(model):
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.set(version_key(model), initial_version(), None)
+
+
+def record(outcome):
+    key = f'{STATS_PREFIX}:{outcome}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_stats():
+    """
+    Счетчики попаданий и промахов кэша ответов.
+    """
+    stats = cache.get_many([f'{STATS_PREFIX}:{HIT}', f'{STATS_PREFIX}:{MISS}'])
+    return {
+        outcome: stats.get(f'{STATS_PREFIX}:{outcome}', 0)
+        for outcome in (HIT, MISS)
+    }
+
+
+def reset_stats():
+    cache.delete_many([f'{STATS_PREFIX}:{HIT}', f'{STATS_PREFIX}:{MISS}'])
+
+
+class AnonymousCacheMixin:
+    """
+    Кэширует данные ответов list и retrieve для анонимных пользователей.
+    Ключ строится из хоста, пути, параметров запроса и версий моделей
+    из cache_models; версии увеличиваются сигналами при изменениях,
+    поэтому устаревшие записи просто перестают запрашиваться.
+    """
+    cache_models = ()
+
+    def get_cache_models(self, request):
+        return self.cache_models
+
+    def get_cache_key(self, request):
+        versions = get_versions(self.get_cache_models(request))
+        query = sorted(request.query_params.lists())
+        raw = f'{request.get_host()}|{request.path}|{query}|{versions}'
+        return (f'{CACHE_PREFIX}:{self.basename}:'
+                f'{hashlib.sha256(raw.encode()).hexdigest()}')
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            record(HIT)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        record(MISS)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.API_RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы по ETag и Last-Modified.
+    Штамп ответа считается методом get_stamp без сериализации,
+    и при совпадении If-None-Match сразу возвращается 304.
+    If-Modified-Since не проверяется: удаление строки или смена
+    флагов пользователя не двигает время изменения, их ловит
+    только ETag, поэтому Last-Modified отдается для информации.
+    """
+
+    def get_stamp(self, request, *args, **kwargs):
+        """
+        Возвращает (части ETag, время изменения в секундах)
+        или None, если условный ответ неприменим.
+        """
+        raise NotImplementedError(
+            'ConditionalGetMixin.get_stamp() must be implemented.'
+        )
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        stamp = self.get_stamp(request, *args, **kwargs)
+        if stamp is None:
+            return handler(request, *args, **kwargs)
+        parts, last_modified = stamp
+        digest = hashlib.sha256(repr((
+            request.get_full_path(), request.accepted_renderer.format, parts
+        )).encode()).hexdigest()
+        etag = quote_etag(digest[:32])
+        last_modified = int(last_modified)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class CatalogConditionalMixin(ConditionalGetMixin):
+    """
+    Условные запросы для справочников (теги, ингредиенты):
+    штамп считается по таблице справочника одним запросом.
+    """
+
+    def get_stamp(self, request, *args, **kwargs):
+        return get_catalog_stamp(self.queryset.model)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
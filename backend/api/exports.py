@@ -0,0 +1,116 @@
+import csv
+import hashlib
+import io
+import os
+from functools import lru_cache
+
+import fpdf
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse
+from fpdf import FPDF
+
+FONT_PATH = os.path.join(settings.BASE_DIR, 'calibri.ttf')
+FONT_FAMILY = 'calibri'
+FONT_SIZE = 14
+CACHE_PREFIX = 'shopping_list'
+CACHE_TIMEOUT = 60 * 60
+FILENAME = 'shopping_list'
+CSV_HEADER = ('name', 'measurement_unit', 'total_amount')
+
+# Метрики шрифта держим в памяти процесса, а не в .pkl рядом с ttf.
+fpdf.set_global('FPDF_CACHE_MODE', 1)
+
+
+@lru_cache(maxsize=None)
+def get_font():
+    """
+    Разбирает calibri.ttf один раз за процесс и возвращает
+    описание шрифта и его файлов в формате FPDF.
+    """
+    pdf = FPDF()
+    pdf.add_font(FONT_FAMILY, '', FONT_PATH, uni=True)
+    return pdf.fonts[FONT_FAMILY], pdf.font_files
+
+
+def attach_font(pdf):
+    """
+    Подключает заранее загруженный шрифт к документу.
+    Изменяемые при рендеринге поля копируются.
+    """
+    font, font_files = get_font()
+    pdf.fonts[FONT_FAMILY] = dict(font, subset=list(font['subset']))
+    pdf.font_files.update(
+        (name, dict(info)) for name, info in font_files.items()
+    )
+
+
+def format_line(item):
+    return (f"{item['name']} - {item['total_amount']} "
+            f"{item['measurement_unit']}")
+
+
+def render_text(cart):
+    """
+    Рендерит список покупок простым текстом, строка на ингредиент.
+    """
+    return ''.join(f'{format_line(item)}\n' for item in cart)
+
+
+def render_csv(cart):
+    """
+    Рендерит список покупок в CSV с заголовком.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    writer.writerows(
+        [item[field] for field in CSV_HEADER] for item in cart
+    )
+    return buffer.getvalue()
+
+
+def render_pdf(cart):
+    """
+    Рендерит список покупок в PDF целиком в памяти.
+    """
+    pdf = FPDF()
+    attach_font(pdf)
+    pdf.add_page()
+    pdf.set_font(FONT_FAMILY, '', FONT_SIZE)
+    for item in cart:
+        pdf.cell(12, 12, txt=format_line(item), align='L', ln=1)
+    return pdf.output(dest='S').encode('latin1')
+
+
+def get_cache_key(cart):
+    """
+    Ключ кэша - хэш агрегированного содержимого корзины,
+    одинаковые корзины используют один документ.
+    """
+    digest = hashlib.sha256()
+    for item in cart:
+        digest.update(
+            f"{item['name']}\0{item['measurement_unit']}\0"
+            f"{item['total_amount']}\n".encode()
+        )
+    return f'{CACHE_PREFIX}:{digest.hexdigest()}'
+
+
+def shopping_list_response(cart):
+    """
+    Отдает PDF со списком покупок потоковым ответом.
+    Повторная выгрузка той же корзины берется из кэша без рендеринга.
+    """
+    cart = list(cart)
+    key = get_cache_key(cart)
+    document = cache.get(key)
+    if document is None:
+        document = render_pdf(cart)
+        cache.set(key, document, CACHE_TIMEOUT)
+    return FileResponse(
+        io.BytesIO(document),
+        as_attachment=True,
+        filename=f'{FILENAME}.pdf',
+        content_type='application/pdf'
+    )
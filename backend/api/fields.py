@@ -0,0 +1,215 @@
+import base64
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import (TemporaryUploadedFile,
+                                            UploadedFile)
+from PIL import Image
+from rest_framework.fields import ImageField, SkipField
+from rest_framework.relations import (MANY_RELATION_KWARGS, ManyRelatedField,
+                                      PrimaryKeyRelatedField)
+from rest_framework.serializers import ListSerializer, ValidationError
+
+# Кратно 4, чтобы каждый кусок base64 декодировался независимо.
+CHUNK_CHARS = 64 * 1024
+BASE64_SEPARATOR = ';base64,'
+# Заголовок data URL ищется только в начале строки.
+MAX_HEADER_CHARS = 256
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """
+    Временный файл с декодированной картинкой. Хранилище при
+    сохранении перемещает его, поэтому закрываем через close(),
+    который не падает на уже отсутствующем файле.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+class StreamingBase64ImageField(ImageField):
+    """
+    Картинка в виде data URL (data:image/png;base64,...).
+    Размер проверяется по длине строки до декодирования, строка
+    декодируется кусками во временный файл, а ширина и высота
+    проверяются по заголовку без полного декодирования картинки.
+    Ссылка http... (уже сохраненная картинка) поле пропускает,
+    у загруженного файла (multipart) проверяются те же ограничения.
+    """
+    default_error_messages = {
+        'invalid_data_url': 'Ожидается картинка в формате data URL base64.',
+        'invalid_base64': 'Некорректные данные base64.',
+        'too_large': 'Картинка больше {max_bytes} байт.',
+        'too_big_dimensions': (
+            'Картинка больше {max_side} пикселей по одной из сторон.'
+        ),
+    }
+
+    def __init__(self, max_bytes=None, max_side=None, **kwargs):
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        super().__init__(**kwargs)
+
+    def get_max_bytes(self):
+        return self.max_bytes or settings.RECIPE_IMAGE_MAX_BYTES
+
+    def get_max_side(self):
+        return self.max_side or settings.RECIPE_IMAGE_MAX_SIDE
+
+    def split_data_url(self, data):
+        """
+        Тип, расширение и позиция начала base64 в строке: сами данные
+        не копируются, их куски берутся из исходной строки.
+        """
+        separator = data.find(BASE64_SEPARATOR, 0, MAX_HEADER_CHARS)
+        if separator == -1:
+            self.fail('invalid_data_url')
+        header = data[:separator]
+        if not header.startswith('data:image/'):
+            self.fail('invalid_data_url')
+        extension = header[len('data:image/'):].split('+')[0].lower()
+        if not extension.isalnum():
+            self.fail('invalid_data_url')
+        return (
+            header[len('data:'):], extension,
+            separator + len(BASE64_SEPARATOR)
+        )
+
+    def decoded_size(self, data, offset):
+        length = len(data) - offset
+        if length % 4:
+            self.fail('invalid_base64')
+        padding = data[max(offset, len(data) - 2):].count('=')
+        return length // 4 * 3 - padding
+
+    def decode_to_file(self, data, offset, content_type, extension, size):
+        file = DecodedImageFile(
+            f'{uuid.uuid4()}.{extension}', content_type, size, None
+        )
+        try:
+            for start in range(offset, len(data), CHUNK_CHARS):
+                file.write(base64.b64decode(
+                    data[start:start + CHUNK_CHARS], validate=True
+                ))
+        except ValueError:
+            # binascii.Error при ошибке в данных, ValueError -
+            # если в строке есть символы не из ASCII.
+            file.close()
+            self.fail('invalid_base64')
+        file.flush()
+        file.seek(0)
+        return file
+
+    def check_size(self, size):
+        max_bytes = self.get_max_bytes()
+        if size > max_bytes:
+            self.fail('too_large', max_bytes=max_bytes)
+
+    def check_dimensions(self, file):
+        max_side = self.get_max_side()
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width = height = max_side + 1
+        except (OSError, SyntaxError, ValueError):
+            file.close()
+            self.fail('invalid_image')
+        file.seek(0)
+        if max(width, height) > max_side:
+            file.close()
+            self.fail('too_big_dimensions', max_side=max_side)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('http'):
+            raise SkipField()
+        if not isinstance(data, str):
+            if isinstance(data, UploadedFile):
+                self.check_size(data.size)
+                self.check_dimensions(data)
+            return super().to_internal_value(data)
+        content_type, extension, offset = self.split_data_url(data)
+        size = self.decoded_size(data, offset)
+        self.check_size(size)
+        file = self.decode_to_file(
+            data, offset, content_type, extension, size
+        )
+        self.check_dimensions(file)
+        return super().to_internal_value(file)
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который при разборе значения только
+    приводит его к типу первичного ключа. Объекты достаются
+    одним запросом для всего списка: в many=True это делает
+    BulkManyRelatedField, во вложенном сериализаторе -
+    BulkRelatedListSerializer.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in MANY_RELATION_KWARGS:
+            if key in kwargs:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def get_objects(self, pks):
+        """
+        {pk: объект} одним запросом IN.
+        """
+        return self.get_queryset().in_bulk(set(pks))
+
+    def missing_error(self, pk):
+        return self.error_messages['does_not_exist'].format(pk_value=pk)
+
+
+class BulkManyRelatedField(ManyRelatedField):
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.child_relation.get_objects(pks)
+        for pk in pks:
+            if pk not in objects:
+                raise ValidationError(self.child_relation.missing_error(pk))
+        return [objects[pk] for pk in pks]
+
+
+class BulkRelatedListSerializer(ListSerializer):
+    """
+    Список вложенных объектов, ссылающихся на другую модель
+    полем BulkPrimaryKeyRelatedField (имя поля - related_field
+    в Meta дочернего сериализатора): ссылки всех элементов
+    проверяются одним запросом.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        field = self.child.fields[self.child.Meta.related_field]
+        pks = [item[field.source] for item in items]
+        objects = field.get_objects(pks)
+        errors = [
+            {} if pk in objects else {field.field_name: [
+                field.missing_error(pk)
+            ]}
+            for pk in pks
+        ]
+        if any(errors):
+            raise ValidationError(errors)
+        for item in items:
+            item[field.source] = objects[item[field.source]]
+        return items
@@ -1,13 +1,16 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
 
-from recipes.models import Recipe, Tag
+from recipes.lookups import get_tag_choices, tag_slug_map
+from recipes.models import Recipe
+from recipes.search import search_recipes
 
 
 class RecipeFilterSet(filters.FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
-        to_field_name='slug'
+    tags = filters.MultipleChoiceFilter(
+        method='get_tags',
+        choices=get_tag_choices
     )
     is_favorited = filters.NumberFilter(
         method='get_is_favorited',
@@ -23,6 +26,18 @@ class RecipeFilterSet(filters.FilterSet):
         fields = ('author', 'tags',
                   'is_favorited', 'is_in_shopping_cart')
 
+    def get_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов: EXISTS по таблице связи
+        с заранее известными id тегов, без JOIN и DISTINCT.
+        """
+        tag_ids = [tag_slug_map.get()[slug] for slug in value]
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag_id__in=tag_ids
+            )
+        ))
+
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
             return queryset.filter(in_favorite__user=self.request.user)
@@ -32,3 +47,24 @@ class RecipeFilterSet(filters.FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(cart__user=self.request.user)
         return queryset.all()
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """
+    Полнотекстовый поиск по названию и описанию рецепта (?search=).
+    Без явной сортировки (?ordering=) результаты идут
+    по убыванию релевантности.
+    """
+    search_param = 'search'
+
+    def get_search_query(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if not query:
+            return queryset
+        queryset = search_recipes(queryset, query)
+        if OrderingFilter.ordering_param in request.query_params:
+            return queryset
+        return queryset.order_by('-search_rank', '-id')
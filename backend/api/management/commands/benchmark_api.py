@@ -0,0 +1,154 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Команда 'benchmark_api' гоняет основные эндпоинты API через
+    тестовый клиент DRF внутри процесса и выводит JSON с p50/p95
+    времени ответа и числом SQL-запросов по каждому сценарию.
+    Работает на текущей базе (SQLite или Postgres), данные удобно
+    готовить командой generate_dataset.
+    python manage.py benchmark_api --iterations 100 --output bench.json
+    """
+    help = 'Бенчмарк основных эндпоинтов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='username пользователя, от имени которого идут запросы; '
+                 'по умолчанию - пользователь с наибольшим числом подписок'
+        )
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            help='Запустить только указанные сценарии'
+        )
+        parser.add_argument('--output', type=str, help='Файл для JSON')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.annotate(
+                follows=Count('follower')
+            ).order_by('-follows', 'id').first()
+        if user is None:
+            raise CommandError('Пользователь не найден.')
+        return user
+
+    def get_workloads(self, rnd):
+        """
+        Сценарии: имя -> функция, возвращающая URL очередного запроса.
+        """
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        if not recipe_ids:
+            raise CommandError('В базе нет рецептов.')
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        tags_query = '&'.join(f'tags={slug}' for slug in slugs)
+        return {
+            'recipes-list': lambda: '/api/recipes/',
+            'recipes-list-page': lambda: (
+                f'/api/recipes/?page={rnd.randint(1, 10)}'
+            ),
+            'recipes-list-tags': lambda: f'/api/recipes/?{tags_query}',
+            'recipes-list-favorited': lambda: (
+                '/api/recipes/?is_favorited=1'
+            ),
+            'recipes-list-cursor': lambda: '/api/recipes/?cursor=',
+            'recipes-feed': lambda: '/api/recipes/feed/',
+            'recipes-detail': lambda: (
+                f'/api/recipes/{rnd.choice(recipe_ids)}/'
+            ),
+            'users-subscriptions': lambda: (
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            'download-shopping-cart-txt': lambda: (
+                '/api/recipes/download_shopping_cart/?format=txt'
+            ),
+            'download-shopping-cart-pdf': lambda: (
+                '/api/recipes/download_shopping_cart/?format=pdf'
+            ),
+            'ingredients-search': lambda: (
+                '/api/ingredients/?name='
+                f'{rnd.choice(names)[:rnd.randint(1, 3)] if names else "a"}'
+            ),
+        }
+
+    def run(self, client, next_url, iterations):
+        timings = []
+        queries = []
+        statuses = set()
+        for _ in range(iterations):
+            url = next_url()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append(time.perf_counter() - started)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+        return dict(self.summarize(timings, queries),
+                    statuses=sorted(statuses))
+
+    def summarize(self, timings, queries):
+        timings = sorted(timings)
+        return {
+            'p50_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(
+                timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                * 1000, 3
+            ),
+            'queries_mean': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        user = self.get_user(options['user'])
+        client = APIClient()
+        client.force_authenticate(user)
+        workloads = self.get_workloads(rnd)
+        only = options['only']
+        if only:
+            unknown = set(only) - set(workloads)
+            if unknown:
+                raise CommandError(
+                    f"Неизвестные сценарии: {', '.join(sorted(unknown))}"
+                )
+            workloads = {name: workloads[name] for name in only}
+        report = {
+            'database': connection.vendor,
+            'user': user.username,
+            'iterations': options['iterations'],
+            'counts': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'results': {
+                name: self.run(client, next_url, options['iterations'])
+                for name, next_url in workloads.items()
+            },
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,143 @@
+import json
+import random
+import time
+
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes import feed
+from recipes.models import Recipe, TimelineEntry
+from users.models import Follow, User
+
+from .benchmark_api import Command as BenchmarkCommand
+
+STRATEGIES = ('read', 'write')
+
+
+class Command(BenchmarkCommand):
+    """
+    Команда 'benchmark_feed' сравнивает стратегии ленты подписок:
+    fan-out-on-read и fan-out-on-write (с порогом по числу
+    подписчиков). Для каждой стратегии ленты пересобираются,
+    затем замеряются первая и вторая страницы /api/recipes/feed/
+    и публикация рецепта (в транзакции, которая откатывается).
+    После замеров ленты пересобираются под текущие настройки.
+    python manage.py benchmark_feed --iterations 100 --threshold 500
+    """
+    help = 'Бенчмарк стратегий ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='username читателя ленты; по умолчанию - '
+                 'пользователь с наибольшим числом подписок'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            help='FEED_FANOUT_MAX_FOLLOWERS для стратегии write'
+        )
+        parser.add_argument('--output', type=str, help='Файл для JSON')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def next_page_url(self, client):
+        response = client.get('/api/recipes/feed/')
+        next_link = response.json()['next']
+        if next_link is None:
+            return '/api/recipes/feed/'
+        return next_link[next_link.index('/api/'):]
+
+    def publish(self, authors, iterations):
+        """
+        Создание рецепта случайным автором с рассылкой по лентам.
+        Каждая публикация откатывается.
+        """
+        timings = []
+        queries = []
+        for _ in range(iterations):
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    Recipe.objects.create(
+                        author_id=self.rnd.choice(authors),
+                        name='benchmark',
+                        text='benchmark',
+                        cooking_time=1
+                    )
+                    timings.append(time.perf_counter() - started)
+                queries.append(len(context.captured_queries))
+                transaction.set_rollback(True)
+        return self.summarize(timings, queries)
+
+    def run_strategy(self, client, authors, iterations):
+        started = time.perf_counter()
+        entries = feed.rebuild()
+        rebuild_ms = round((time.perf_counter() - started) * 1000, 3)
+        next_url = self.next_page_url(client)
+        return {
+            'rebuild_ms': rebuild_ms,
+            'timeline_entries': entries,
+            'fanned_out_recipes': Recipe.objects.filter(
+                fanned_out=True
+            ).count(),
+            'feed-first-page': self.run(
+                client, lambda: '/api/recipes/feed/', iterations
+            ),
+            'feed-next-page': self.run(
+                client, lambda: next_url, iterations
+            ),
+            'publish': self.publish(authors, iterations),
+        }
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        user = self.get_user(options['user'])
+        client = APIClient()
+        client.force_authenticate(user)
+        authors = list(Follow.objects.values_list(
+            'author_id', flat=True
+        ).distinct())
+        if not authors:
+            authors = list(User.objects.values_list('id', flat=True))
+        write_settings = {'FEED_STRATEGY': 'write'}
+        if options['threshold'] is not None:
+            write_settings['FEED_FANOUT_MAX_FOLLOWERS'] = options['threshold']
+        results = {}
+        try:
+            for strategy in STRATEGIES:
+                strategy_settings = (
+                    write_settings if strategy == 'write'
+                    else {'FEED_STRATEGY': strategy}
+                )
+                with override_settings(**strategy_settings):
+                    results[strategy] = self.run_strategy(
+                        client, authors, options['iterations']
+                    )
+        finally:
+            feed.rebuild()
+        report = {
+            'database': connection.vendor,
+            'user': user.username,
+            'follows': Follow.objects.filter(user=user).count(),
+            'iterations': options['iterations'],
+            'threshold': write_settings.get(
+                'FEED_FANOUT_MAX_FOLLOWERS', feed.get_max_followers()
+            ),
+            'timeline_length': feed.get_timeline_length(),
+            'counts': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'follows': Follow.objects.count(),
+                'timeline_entries': TimelineEntry.objects.count(),
+            },
+            'results': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.serializers import IngredientSerializer
+from recipes.autocomplete import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    """
+    Команда 'benchmark_ingredient_search' сравнивает поиск ингредиентов
+    по началу названия через ORM (istartswith + сериализатор)
+    и через индекс автодополнения в памяти.
+    Ингредиенты должны быть загружены в базу заранее.
+    """
+    help = 'Бенчмарк поиска ингредиентов для автодополнения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Число случайных префиксов'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Ограничение числа результатов автодополнения'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def get_prefixes(self, count, seed):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('В базе нет ингредиентов.')
+        rnd = random.Random(seed)
+        return [
+            name[:rnd.randint(1, min(len(name), 4))]
+            for name in rnd.choices(names, k=count)
+        ]
+
+    def measure(self, search, prefixes):
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            search(prefix)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        return (
+            statistics.median(timings) * 1000,
+            timings[int(len(timings) * 0.95) - 1] * 1000
+        )
+
+    def handle(self, *args, **options):
+        prefixes = self.get_prefixes(options['queries'], options['seed'])
+        limit = options['limit']
+        started = time.perf_counter()
+        ingredient_index.invalidate()
+        ingredient_index.get()
+        self.stdout.write(
+            f'Построение индекса: '
+            f'{(time.perf_counter() - started) * 1000:.1f} ms'
+        )
+        paths = {
+            'orm': lambda prefix: IngredientSerializer(
+                Ingredient.objects.filter(name__istartswith=prefix),
+                many=True
+            ).data,
+            'orm+limit': lambda prefix: IngredientSerializer(
+                Ingredient.objects.filter(
+                    name__istartswith=prefix
+                )[:limit],
+                many=True
+            ).data,
+            'index': lambda prefix: ingredient_index.search(prefix, limit),
+        }
+        self.stdout.write(f"{'path':>10} {'p50 ms':>10} {'p95 ms':>10}")
+        for name, search in paths.items():
+            median, p95 = self.measure(search, prefixes)
+            self.stdout.write(f'{name:>10} {median:>10.3f} {p95:>10.3f}')
@@ -0,0 +1,96 @@
+import random
+import time
+import tracemalloc
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.exports import render_csv, render_pdf, render_text
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+
+RENDERERS = {
+    'txt': render_text,
+    'csv': render_csv,
+    'json': JSONRenderer().render,
+    'pdf': render_pdf,
+}
+
+
+class Command(BaseCommand):
+    """
+    Команда 'benchmark_shopping_list' сравнивает время и пиковую
+    память выгрузки списка покупок в каждом формате
+    для корзин из 10, 100 и 1000 рецептов.
+    База данных не используется: агрегат корзины генерируется.
+    """
+    help = 'Бенчмарк форматов выгрузки списка покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            nargs='+',
+            default=[10, 100, 1000],
+            help='Размеры корзин в рецептах'
+        )
+        parser.add_argument(
+            '--catalog',
+            type=int,
+            default=2000,
+            help='Число различных ингредиентов в каталоге'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Число повторов замера'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def make_cart(self, recipes, catalog, rnd):
+        """
+        Собирает агрегат корзины так же, как
+        download_shopping_cart после annotate(Sum('amount')).
+        """
+        totals = Counter()
+        for _ in range(recipes):
+            for ingredient in rnd.sample(range(catalog), rnd.randint(5, 20)):
+                key = (f'Ингредиент {ingredient}',
+                       UNITS[ingredient % len(UNITS)])
+                totals[key] += rnd.randint(1, 500)
+        return [
+            {'name': name, 'measurement_unit': unit, 'total_amount': amount}
+            for (name, unit), amount in sorted(totals.items())
+        ]
+
+    def measure(self, render, cart, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render(cart)
+            timings.append(time.perf_counter() - started)
+        tracemalloc.start()
+        output = render(cart)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return min(timings), peak, len(output)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        self.stdout.write(
+            f"{'recipes':>8} {'lines':>6} {'format':>6} "
+            f"{'ms':>10} {'peak KiB':>10} {'size KiB':>10}"
+        )
+        for recipes in options['recipes']:
+            cart = self.make_cart(recipes, options['catalog'], rnd)
+            for export_format, render in RENDERERS.items():
+                seconds, peak, size = self.measure(
+                    render, cart, options['repeat']
+                )
+                self.stdout.write(
+                    f'{recipes:>8} {len(cart):>6} {export_format:>6} '
+                    f'{seconds * 1000:>10.2f} {peak / 1024:>10.1f} '
+                    f'{size / 1024:>10.1f}'
+                )
@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.middleware import (SAMPLE_FIELDS, load_histograms,
+                                 reset_histograms)
+
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000)
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def latency_histogram(values):
+    """
+    Число замеров в каждом интервале времени ответа (мс).
+    """
+    counts = [0] * (len(LATENCY_BUCKETS) + 1)
+    for value in values:
+        position = 0
+        while (position < len(LATENCY_BUCKETS)
+               and value >= LATENCY_BUCKETS[position]):
+            position += 1
+        counts[position] += 1
+    return '/'.join(str(count) for count in counts)
+
+
+class Command(BaseCommand):
+    """
+    Команда 'endpoint_stats' выводит по маршрутам API сводку замеров
+    InstrumentationMiddleware: число SQL-запросов, время в БД,
+    время сериализации, полное время и размер ответа.
+    Замеры попадают сюда из процессов сервера через кэш, поэтому
+    с LocMemCache команда видит только собственный процесс.
+    """
+    help = 'Статистика запросов к API по маршрутам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Очистить замеры после вывода'
+        )
+        parser.add_argument(
+            '--sort',
+            choices=SAMPLE_FIELDS,
+            default='queries',
+            help='Поле сортировки маршрутов (по p95)'
+        )
+
+    def handle(self, *args, **options):
+        histograms = load_histograms()
+        if not histograms:
+            self.stdout.write('Замеров нет.')
+            return
+        rows = []
+        for route, samples in histograms.items():
+            columns = {
+                field: sorted(values)
+                for field, values in zip(SAMPLE_FIELDS, zip(*samples))
+            }
+            rows.append((route, len(samples), columns))
+        position = SAMPLE_FIELDS.index(options['sort'])
+        rows.sort(key=lambda row: percentile(
+            row[2][SAMPLE_FIELDS[position]], 0.95
+        ), reverse=True)
+        self.stdout.write(
+            f"{'route':<32} {'n':>6} {'sql p50':>8} {'sql max':>8} "
+            f"{'db p95':>8} {'ser p95':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'bytes p50':>10}  "
+            f"ms {'/'.join(map(str, LATENCY_BUCKETS))}/+"
+        )
+        for route, count, columns in rows:
+            self.stdout.write(
+                f'{route:<32} {count:>6} '
+                f"{percentile(columns['queries'], 0.5):>8} "
+                f"{columns['queries'][-1]:>8} "
+                f"{percentile(columns['db_ms'], 0.95):>8.2f} "
+                f"{percentile(columns['serializer_ms'], 0.95):>8.2f} "
+                f"{percentile(columns['total_ms'], 0.5):>8.2f} "
+                f"{percentile(columns['total_ms'], 0.95):>8.2f} "
+                f"{percentile(columns['size'], 0.5):>10}  "
+                f"{latency_histogram(columns['total_ms'])}"
+            )
+        if options['reset']:
+            reset_histograms()
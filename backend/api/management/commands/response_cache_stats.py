@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    """
+    Команда 'response_cache_stats' выводит счетчики попаданий
+    и промахов кэша ответов API.
+    Для LocMemCache счетчики видны только внутри процесса сервера,
+    поэтому команда полезна с общим бэкендом кэша (файловым и т.п.).
+    """
+    help = 'Статистика кэша ответов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счетчики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        total = sum(stats.values())
+        ratio = stats['hit'] / total * 100 if total else 0
+        self.stdout.write(
+            f"hit: {stats['hit']}, miss: {stats['miss']}, "
+            f'hit ratio: {ratio:.1f}%'
+        )
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+# Отдельные ограниченные пулы: выгрузки списков покупок не занимают
+# потоки, нужные для сохранения рецептов с картинками, и наоборот.
+export_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'EXPORT_POOL_SIZE', 2),
+    thread_name_prefix='export'
+)
+upload_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'UPLOAD_POOL_SIZE', 4),
+    thread_name_prefix='upload'
+)
+
+
+def call_in_pool(view, request, *args, **kwargs):
+    """
+    Выполняет синхронную вью в потоке пула вместе с рендерингом
+    ответа. Соединения с БД потока пула закрываются по тем же
+    правилам, что и после обычного запроса.
+
+    У потока пула свои соединения с БД: он не видит незакоммиченных
+    изменений вызывающего потока (например, транзакции TestCase),
+    а CaptureQueriesContext вызывающего потока не видит его запросов.
+    Поэтому вью выносятся в пулы только под ASGI (OFFLOAD_VIEWS,
+    см. foodgram.asgi), а запросы считает
+    foodgram.middleware.count_queries, подключенный ко всем соединениям.
+    """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def offload(view, executor, methods=None):
+    """
+    Асинхронный вариант синхронной вью: запросы с методами из methods
+    (или все, если methods не задан) выполняются в пуле executor,
+    а не в общем потоке синхронного кода ASGI-обработчика, поэтому
+    долгая выгрузка не блокирует остальные запросы воркера.
+    """
+    in_pool = sync_to_async(
+        call_in_pool, thread_sensitive=False, executor=executor
+    )
+    in_thread = sync_to_async(view)
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        if methods is None or request.method in methods:
+            return await in_pool(view, request, *args, **kwargs)
+        return await in_thread(request, *args, **kwargs)
+    return async_view
+
+
+def offload_urls(urls, offloaded):
+    """
+    Заменяет вью маршрутов с именами из offloaded
+    ({имя: (executor, methods)}) на асинхронные варианты.
+    """
+    patterns = []
+    for pattern in urls:
+        if isinstance(pattern, URLPattern) and pattern.name in offloaded:
+            executor, methods = offloaded[pattern.name]
+            pattern = URLPattern(
+                pattern.pattern,
+                offload(pattern.callback, executor, methods),
+                pattern.default_args,
+                pattern.name
+            )
+        patterns.append(pattern)
+    return patterns
@@ -1,4 +1,15 @@
-﻿from rest_framework.pagination import PageNumberPagination
+﻿import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PagePaginator(PageNumberPagination):
@@ -9,3 +20,142 @@ class PagePaginator(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 50
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Сохраняет время в курсоре с микросекундами,
+    иначе равные по времени записи будут пропущены.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagePaginator(PagePaginator):
+    """
+    Пагинатор с дополнительным режимом курсора (keyset).
+    По умолчанию работает как PagePaginator (?page=&limit=).
+    С параметром ?cursor= (для первой страницы - пустым) страница
+    выбирается условием по ключу сортировки последнего элемента,
+    без OFFSET и без COUNT(*). Ключ сортировки задает вью методом
+    get_keyset_ordering(), например ('-pub_date', '-id').
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_keyset_ordering(self, view):
+        get_ordering = getattr(view, 'get_keyset_ordering', None)
+        return get_ordering() if get_ordering else None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_ordering = None
+        if self.cursor_query_param in request.query_params:
+            self.keyset_ordering = self.get_keyset_ordering(view)
+        if not self.keyset_ordering:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    def paginate_keyset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.keyset_ordering)
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.get_keyset_filter(position))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], field.lstrip('-'))
+                for field in self.keyset_ordering
+            ]
+        return page
+
+    def get_keyset_filter(self, position):
+        """
+        Условие "после позиции" для составного ключа:
+        (a < va) OR (a = va AND b < vb) ... с учетом направлений.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.keyset_ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.keyset_ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(
+            json.dumps(position, cls=CursorEncoder).encode()
+        ).decode()
+
+    def get_next_link(self):
+        if not self.keyset_ordering:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        if not self.keyset_ordering:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class FeedPaginator(KeysetPagePaginator):
+    """
+    Курсорный пагинатор для лент, которые собираются не одним
+    запросом. Ключи страницы (pub_date, id) отдает вью методом
+    get_feed_keys(position, limit), рецепты затем достаются
+    из queryset вью одним запросом по id.
+    """
+
+    feed_ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keyset_ordering = self.feed_ordering
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, '')
+        )
+        try:
+            keys = view.get_feed_keys(position, page_size + 1)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        self.next_position = None
+        if len(keys) > page_size:
+            keys = keys[:page_size]
+            self.next_position = list(keys[-1])
+        recipes = queryset.in_bulk([pk for _, pk in keys])
+        return [recipes[pk] for _, pk in keys if pk in recipes]
@@ -0,0 +1,51 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils import json
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'request_too_large'
+
+
+def get_request_max_bytes():
+    """
+    Предел тела запроса: картинка максимального размера в base64
+    плюс запас на остальные поля рецепта.
+    """
+    return (settings.RECIPE_IMAGE_MAX_BYTES * 4 // 3
+            + settings.RECIPE_REQUEST_EXTRA_BYTES)
+
+
+class LimitedJSONParser(JSONParser):
+    """
+    JSON-парсер с ограничением размера тела. Content-Length
+    проверяется до чтения, поток читается не дальше предела,
+    а байты разбираются без промежуточной декодированной строки.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        limit = get_request_max_bytes()
+        request = parser_context.get('request')
+        if request is not None:
+            try:
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            if length > limit:
+                raise RequestTooLarge()
+        body = stream.read(limit + 1)
+        if len(body) > limit:
+            raise RequestTooLarge()
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                body = body.decode(encoding)
+            parse_constant = json.strict_constant if self.strict else None
+            return json.loads(body, parse_constant=parse_constant)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
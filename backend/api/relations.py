@@ -0,0 +1,59 @@
+from django.utils.functional import cached_property
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+REQUEST_ATTRIBUTE = '_user_relations'
+
+
+class UserRelations:
+    """
+    Связи текущего пользователя: на кого он подписан, что у него
+    в избранном и в списке покупок. Каждое множество загружается
+    одним запросом при первом обращении и живет до конца запроса,
+    так что проверки в сериализаторах сводятся к поиску в множестве.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def get_ids(self, model, field):
+        if self.user.is_anonymous:
+            return frozenset()
+        return set(
+            model.objects.filter(user=self.user).values_list(
+                field, flat=True
+            )
+        )
+
+    @cached_property
+    def followed_ids(self):
+        return self.get_ids(Follow, 'author_id')
+
+    @cached_property
+    def favorite_ids(self):
+        return self.get_ids(Favorite, 'recipe_id')
+
+    @cached_property
+    def cart_ids(self):
+        return self.get_ids(ShoppingCart, 'recipe_id')
+
+    def is_subscribed(self, author):
+        return author.pk in self.followed_ids
+
+    def is_favorited(self, recipe):
+        return recipe.pk in self.favorite_ids
+
+    def is_in_shopping_cart(self, recipe):
+        return recipe.pk in self.cart_ids
+
+
+def get_relations(request):
+    """
+    Возвращает UserRelations, запомненный на объекте запроса.
+    """
+    relations = getattr(request, REQUEST_ATTRIBUTE, None)
+    if relations is None or relations.user is not request.user:
+        relations = UserRelations(request.user)
+        setattr(request, REQUEST_ATTRIBUTE, relations)
+    return relations
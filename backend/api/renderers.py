@@ -0,0 +1,48 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .exports import render_csv, render_pdf, render_text
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+    Ошибки (401 и т.п.) отдаются в JSON независимо от формата.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None and response.exception:
+            response['Content-Type'] = JSONRenderer.media_type
+            return JSONRenderer().render(data)
+        return self.render_cart(data)
+
+    def render_cart(self, cart):
+        raise NotImplementedError(
+            'ShoppingListRenderer.render_cart() must be implemented.'
+        )
+
+
+class PDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render_cart(self, cart):
+        return render_pdf(cart)
+
+
+class PlainTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render_cart(self, cart):
+        return render_text(cart)
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render_cart(self, cart):
+        return render_csv(cart)
@@ -1,19 +1,27 @@
-﻿from django.db.transaction import atomic
+﻿from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.db.transaction import atomic
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework.serializers import (IntegerField, ModelSerializer,
-                                        PrimaryKeyRelatedField,
+                                        PrimaryKeyRelatedField, Serializer,
                                         SlugRelatedField,
                                         SerializerMethodField,
                                         ValidationError)
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
+from foodgram.middleware import TimedSerializerMixin
+from recipes import carts
+from recipes.images import discard_variants, schedule_variants
+from recipes.models import (CartIngredient, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart, Tag)
 from users.models import Follow, User
 
+from .fields import (BulkPrimaryKeyRelatedField, BulkRelatedListSerializer,
+                     StreamingBase64ImageField)
+from .relations import get_relations
 
-class CustomUserSerializer(UserSerializer):
+
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     """
     Класс сериализатора для управления пользователями.
     """
@@ -37,12 +45,12 @@ class CustomUserSerializer(UserSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        return Follow.objects.filter(
-            user=request.user, author=username
-        ).exists()
+        if hasattr(username, 'is_subscribed'):
+            return username.is_subscribed
+        return get_relations(request).is_subscribed(username)
 
 
-class CustomUserCreateSerializer(UserCreateSerializer):
+class CustomUserCreateSerializer(TimedSerializerMixin, UserCreateSerializer):
     """
     Сериализатор для регистрации пользователя.
     """
@@ -69,7 +77,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         return user
 
 
-class FollowListSerializer(ModelSerializer):
+class FollowListSerializer(TimedSerializerMixin, ModelSerializer):
     """
     Класс сериализатора списка на кого подписан пользователь.
     """
@@ -87,10 +95,19 @@ class FollowListSerializer(ModelSerializer):
         )
 
     def get_recipes_count(self, author):
+        if hasattr(author, 'recipes_count'):
+            return author.recipes_count
         return Recipe.objects.filter(author=author).count()
 
     def get_recipes(self, author):
         queryset = self.context.get('request')
+        if hasattr(author, 'recipe_previews'):
+            return RecipeShortInfo(
+                author.recipe_previews,
+                many=True, context={
+                    'request': queryset
+                }
+            ).data
         recipes_limit = queryset.query_params.get('recipes_limit')
         if not recipes_limit:
             return RecipeShortInfo(
@@ -108,13 +125,14 @@ class FollowListSerializer(ModelSerializer):
         ).data
 
     def get_is_subscribed(self, author):
-        return Follow.objects.filter(
-            user=self.context.get('request').user,
-            author=author
-        ).exists()
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return get_relations(
+            self.context.get('request')
+        ).is_subscribed(author)
 
 
-class FollowSerializer(ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, ModelSerializer):
     """
     Класс сериализатора для управления подписками.
     """
@@ -144,7 +162,7 @@ class FollowSerializer(ModelSerializer):
         ).data
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
     """
     Сериализатор для тегов.
     """
@@ -154,7 +172,7 @@ class TagSerializer(ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, ModelSerializer):
     """
     Сериализатор для ингредиентов.
     """
@@ -188,7 +206,41 @@ class IngredientRecipeSerializer(ModelSerializer):
         )
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeImageMixin:
+    """
+    Ссылки на картинку рецепта. Поле image отдает JPEG-копию
+    размера image_variant, пока копии не готовы - оригинал;
+    поле images - все копии во всех форматах и оригинал.
+    """
+    image_variant = 'medium'
+
+    def get_image_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image(self, obj):
+        variant = obj.image_variants.get(self.image_variant)
+        if variant:
+            return self.get_image_url(variant['jpeg'])
+        return self.get_image_url(obj.image.name) if obj.image else None
+
+    def get_images(self, obj):
+        images = {
+            variant: {
+                image_format: self.get_image_url(name)
+                for image_format, name in formats.items()
+            }
+            for variant, formats in obj.image_variants.items()
+        }
+        images['original'] = (
+            self.get_image_url(obj.image.name) if obj.image else None
+        )
+        return images
+
+
+class RecipeSerializer(TimedSerializerMixin, RecipeImageMixin,
+                       ModelSerializer):
     """
     Сериализатор для рецептов.
     """
@@ -202,32 +254,52 @@ class RecipeSerializer(ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
     is_favorited = SerializerMethodField(read_only=True)
+    image = SerializerMethodField()
+    images = SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'images', 'text', 'cooking_time'
         )
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user,
-            recipe__id=obj.id
-        ).exists()
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return get_relations(self.context.get('request')).is_favorited(obj)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user,
-            recipe__id=obj.id
-        ).exists()
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return get_relations(
+            self.context.get('request')
+        ).is_in_shopping_cart(obj)
+
+
+class CartIngredientSerializer(TimedSerializerMixin, ModelSerializer):
+    """
+    Строка сводки списка покупок.
+    """
+    id = PrimaryKeyRelatedField(
+        source='ingredient',
+        read_only=True
+    )
+    name = SlugRelatedField(
+        slug_field='name',
+        source='ingredient',
+        read_only=True
+    )
+    measurement_unit = SlugRelatedField(
+        slug_field='measurement_unit',
+        source='ingredient',
+        read_only=True
+    )
+
+    class Meta:
+        model = CartIngredient
+        fields = ('id', 'name', 'measurement_unit', 'total_amount')
 
 
 class CreateIngredientRecipeSerializer(ModelSerializer):
@@ -235,7 +307,7 @@ class CreateIngredientRecipeSerializer(ModelSerializer):
     Сериализатор для создания ингредиентов.
     """
 
-    id = PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         source='ingredient',
         queryset=Ingredient.objects.all()
     )
@@ -243,6 +315,8 @@ class CreateIngredientRecipeSerializer(ModelSerializer):
     class Meta:
         model = IngredientRecipe
         fields = ('id', 'amount')
+        list_serializer_class = BulkRelatedListSerializer
+        related_field = 'id'
 
     def validate_amount(self, data):
         if int(data) < 1:
@@ -261,15 +335,15 @@ class CreateIngredientRecipeSerializer(ModelSerializer):
         )
 
 
-class CreateRecipeSerializer(ModelSerializer):
+class CreateRecipeSerializer(TimedSerializerMixin, ModelSerializer):
     """
     Сериализатор для создания рецептов.
     """
 
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField(use_url=True, max_length=None)
+    image = StreamingBase64ImageField(use_url=True)
     ingredients = CreateIngredientRecipeSerializer(many=True)
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
     cooking_time = IntegerField()
 
     class Meta:
@@ -289,15 +363,13 @@ class CreateRecipeSerializer(ModelSerializer):
         ])
 
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise ValidationError(
-                    'Есть повторяющиеся ингредиенты!'
-                )
-            ingredients_list.append(ingredient_id)
+        ingredients = data.get('ingredients', ())
+        if len({
+            ingredient['ingredient'].pk for ingredient in ingredients
+        }) < len(ingredients):
+            raise ValidationError(
+                'Есть повторяющиеся ингредиенты!'
+            )
         if data['cooking_time'] <= 0:
             raise ValidationError(
                 'Время приготовления не должно быть 0.'
@@ -315,56 +387,116 @@ class CreateRecipeSerializer(ModelSerializer):
         )
         self.create_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
+        schedule_variants(recipe)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Приводит ингредиенты рецепта к присланным, трогая только
+        изменившиеся строки: новые вставляются, у оставшихся
+        обновляется количество, лишние удаляются.
+        Возвращает количества до и после: {id ингредиента: amount}.
+        """
+        existing = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe).only(
+                'id', 'ingredient_id', 'amount'
+            )
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in existing.items()
+        }
+        new_amounts = {
+            ingredient['ingredient'].pk: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = existing.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient'].pk not in existing
+        ]
+        if added:
+            self.create_ingredients(recipe, added)
+        removed = [
+            row.pk for ingredient_id, row in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            IngredientRecipe.objects.filter(pk__in=removed).delete()
+        return old_amounts, new_amounts
+
     @atomic
     def update(self, instance, validated_data):
+        """
+        Теги обновляет ModelSerializer через tags.set(),
+        который тоже меняет только разницу.
+        """
         ingredients = validated_data.pop('ingredients')
         recipe = instance
-        IngredientRecipe.objects.filter(recipe=recipe).delete()
-        self.create_ingredients(recipe, ingredients)
+        old_amounts, new_amounts = self.update_ingredients(
+            recipe, ingredients
+        )
+        carts.update_recipe(recipe.pk, old_amounts, new_amounts)
+        if 'image' in validated_data:
+            discard_variants(recipe.image_variants)
+            validated_data['image_variants'] = {}
+            schedule_variants(recipe)
         return super().update(recipe, validated_data)
 
     def to_representation(self, instance):
+        """
+        Рецепт перечитывается тем же запросом, что и в списке:
+        кэш prefetch после записи устарел, а без него теги
+        и ингредиенты догружались бы по одному.
+        """
+        request = self.context.get('request')
         return RecipeSerializer(
-            instance,
+            Recipe.objects.with_related(request.user).get(pk=instance.pk),
             context={
-                'request': self.context.get('request'),
+                'request': request,
             }
         ).data
 
 
-class RecipeShortInfo(ModelSerializer):
+class RecipeShortInfo(RecipeImageMixin, ModelSerializer):
+    image_variant = 'thumbnail'
+    image = SerializerMethodField()
+    images = SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = (
             'id', 'name',
-            'image', 'cooking_time'
+            'image', 'images', 'cooking_time'
         )
 
 
-class FavoriteSerializer(ModelSerializer):
+class UserRecipeSerializer(TimedSerializerMixin, ModelSerializer):
     """
-    Добавление рецепта в избранное.
+    Базовый сериализатор связи пользователя с рецептом.
+    Повторное добавление отсекается уникальным ограничением в БД,
+    поэтому запись делается одной вставкой без предварительной проверки.
     """
+    duplicate_error = None
 
     class Meta:
-        model = Favorite
         fields = ('user', 'recipe')
+        read_only_fields = ('user',)
 
-    def validate(self, data):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        recipe = data['recipe']
-        if Favorite.objects.filter(
-            user=request.user,
-            recipe=recipe
-        ).exists():
-            raise ValidationError({
-                'errors': 'Этот рецепт уже добавлен в избранное!'
-            })
-        return data
+    def create(self, validated_data):
+        try:
+            with atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise ValidationError({'errors': self.duplicate_error})
 
     def to_representation(self, instance):
         request = self.context.get('request')
@@ -377,32 +509,48 @@ class FavoriteSerializer(ModelSerializer):
         ).data
 
 
-class ShoppingCartSerializer(ModelSerializer):
+class FavoriteSerializer(UserRecipeSerializer):
+    """
+    Добавление рецепта в избранное.
+    """
+    duplicate_error = 'Этот рецепт уже добавлен в избранное!'
+
+    class Meta(UserRecipeSerializer.Meta):
+        model = Favorite
+
+
+class ShoppingCartSerializer(UserRecipeSerializer):
     """
     Добавление рецепта в список покупок.
     """
+    duplicate_error = 'Рецепт уже добавлен в список покупок!'
 
-    class Meta:
+    class Meta(UserRecipeSerializer.Meta):
         model = ShoppingCart
-        fields = ('recipe', 'user')
 
-    def validate(self, data):
-        request = self.context.get('request')
-        recipe = data['recipe']
-        if ShoppingCart.objects.filter(
-            user=request.user,
-            recipe=recipe
-        ).exists():
-            raise ValidationError({
-                'errors': 'Рецепт уже добавлен в список покупок!'})
-        return data
 
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {
-            'request': request
-        }
-        return RecipeShortInfo(
-            instance.recipe,
-            context=context
-        ).data
+class RecipeIdsSerializer(Serializer):
+    """
+    Список рецептов для массовых операций с избранным
+    и списком покупок. Все id проверяются одним запросом.
+    """
+    recipes = BulkPrimaryKeyRelatedField(
+        queryset=Recipe.objects.all(), many=True, allow_empty=False
+    )
+
+
+class RecipeSetSerializer(RecipeIdsSerializer):
+    """
+    Полный желаемый набор рецептов, может быть пустым.
+    """
+    recipes = BulkPrimaryKeyRelatedField(
+        queryset=Recipe.objects.all(), many=True
+    )
+
+
+class BulkResultSerializer(TimedSerializerMixin, Serializer):
+    """
+    Результат массовой операции: добавленные и удаленные рецепты.
+    """
+    added = RecipeShortInfo(many=True)
+    removed = RecipeShortInfo(many=True)
@@ -0,0 +1,31 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from recipes.models import Recipe
+from recipes.signals import bulk_loaded
+from users.models import User
+
+from .cache import COUNTER_MODELS, RECIPE_MODELS, bump_version
+
+
+def invalidate_responses(sender, **kwargs):
+    """
+    Увеличивает версию модели после коммита транзакции,
+    чтобы параллельный запрос не закэшировал старые данные
+    под новой версией.
+    """
+    if sender is User and kwargs.get('update_fields') == {'last_login'}:
+        return
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+def invalidate_recipe_tags(sender, **kwargs):
+    if kwargs['action'].startswith('post_'):
+        transaction.on_commit(lambda: bump_version(Recipe))
+
+
+for model in RECIPE_MODELS + COUNTER_MODELS:
+    post_save.connect(invalidate_responses, sender=model)
+    post_delete.connect(invalidate_responses, sender=model)
+    bulk_loaded.connect(invalidate_responses, sender=model)
+m2m_changed.connect(invalidate_recipe_tags, sender=Recipe.tags.through)
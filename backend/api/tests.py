@@ -0,0 +1,1111 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.serializers import ListSerializer, ValidationError
+from rest_framework.test import APIClient
+
+from foodgram.middleware import (RequestMetrics, TimedListSerializer,
+                                 TimedSerializerMixin, current_metrics,
+                                 install_query_counting)
+from recipes import bulk, carts
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag, TimelineEntry)
+from recipes.units import fold_units
+from users.models import Follow, User
+
+from .cache import HIT, MISS, get_stats, reset_stats
+from .exports import get_cache_key
+from .fields import StreamingBase64ImageField
+from .offload import offload, offload_urls
+from .relations import get_relations
+from .serializers import RecipeSerializer, TagSerializer
+from .urls import OFFLOADED, router
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class APITestCase(TestCase):
+    """
+    Общие данные: авторы с рецептами, теги и ингредиенты.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Тестовый', password='pass'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author-{number}',
+                email=f'author-{number}@example.com',
+                first_name='Автор', last_name=str(number), password='pass'
+            ) for number in range(3)
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', slug=f'tag-{number}', color='#FF0000'
+            ) for number in range(3)
+        ]
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(40)
+        ])
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.recipes = []
+        for number in range(60):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % 3],
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/test.png'
+            )
+            recipe.tags.set(cls.tags[:number % 3 + 1])
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[(number + shift) % 40],
+                    amount=shift + 1
+                ) for shift in range(5)
+            ])
+            cls.recipes.append(recipe)
+        Follow.objects.create(user=cls.user, author=cls.authors[0])
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeListQueriesTest(APITestCase):
+    """
+    Число запросов списка рецептов не зависит от размера страницы.
+    """
+
+    def test_anonymous(self):
+        for limit in (6, 50):
+            cache.clear()
+            with self.assertNumQueries(4):
+                response = self.anonymous.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_authenticated(self):
+        for limit in (6, 50):
+            with self.assertNumQueries(5):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+
+class SubscriptionsTest(APITestCase):
+    """
+    Подписки: число запросов не зависит от размера страницы
+    и от числа рецептов в превью.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for author in self.authors[1:]:
+            Follow.objects.create(user=self.user, author=author)
+
+    def test_queries(self):
+        url = '/api/users/subscriptions/'
+        for params in ({'limit': 1}, {'limit': 3},
+                       {'limit': 3, 'recipes_limit': 2}):
+            with self.assertNumQueries(3):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), params['limit'])
+        authors = response.data['results']
+        self.assertEqual(
+            [author['id'] for author in authors],
+            [author.pk for author in self.authors]
+        )
+        for author in authors:
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(author['recipes_count'], 20)
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                list(Recipe.objects.filter(author_id=author['id']).order_by(
+                    '-pub_date', '-id'
+                ).values_list('id', flat=True)[:2])
+            )
+
+
+class CursorTest(APITestCase):
+    """
+    Курсор с данными не того типа - 404, а не 500.
+    """
+
+    def test_invalid_cursor(self):
+        for cursor in ('WyJ4IiwgMV0=', 'WzEsICJ4Il0=', 'W251bGwsIDFd',
+                       'W1tdLCB7fV0=', 'zzz'):
+            for url in ('/api/recipes/', '/api/recipes/feed/'):
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404, (url, cursor))
+
+    def test_cursor_walk(self):
+        seen = []
+        response = self.client.get('/api/recipes/', {'cursor': ''})
+        while True:
+            seen += [recipe['id'] for recipe in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(
+            seen,
+            list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            ))
+        )
+
+
+class RelationTest(APITestCase):
+    """
+    Добавление в избранное, корзину и подписка: повтор отсекается
+    уникальным ограничением, несуществующий рецепт - 400.
+    """
+
+    def test_missing_recipe(self):
+        for action in ('favorite', 'shopping_cart'):
+            response = self.client.post(f'/api/recipes/0/{action}/')
+            self.assertEqual(response.status_code, 400, action)
+            self.assertIn('recipe', response.data)
+
+    def test_duplicate(self):
+        recipe = self.recipes[5]
+        for action, model in (('favorite', Favorite),
+                              ('shopping_cart', ShoppingCart)):
+            url = f'/api/recipes/{recipe.pk}/{action}/'
+            self.assertEqual(self.client.post(url).status_code, 201)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(url)
+            self.assertEqual(response.status_code, 400, action)
+            self.assertIn('errors', response.data)
+            self.assertFalse(any(
+                query['sql'].startswith('SELECT')
+                and model._meta.db_table in query['sql']
+                for query in context.captured_queries
+            ), action)
+            self.assertEqual(
+                model.objects.filter(user=self.user, recipe=recipe).count(), 1
+            )
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.favorites_count, recipe.carts_count), (1, 1))
+
+    def test_duplicate_follow(self):
+        url = f'/api/users/{self.authors[1].pk}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(
+            Follow.objects.filter(
+                user=self.user, author=self.authors[1]
+            ).count(), 1
+        )
+
+
+class UserRelationsTest(APITestCase):
+    """
+    Флаги связей текущего пользователя берутся из множеств id,
+    загруженных один раз за запрос.
+    """
+
+    def test_memoized(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        relations = get_relations(request)
+        self.assertIs(get_relations(request), relations)
+        with self.assertNumQueries(3):
+            for recipe in self.recipes:
+                relations.is_favorited(recipe)
+                relations.is_in_shopping_cart(recipe)
+            for author in self.authors:
+                relations.is_subscribed(author)
+        self.assertTrue(relations.is_favorited(self.recipes[0]))
+        self.assertTrue(relations.is_in_shopping_cart(self.recipes[1]))
+        self.assertFalse(relations.is_in_shopping_cart(self.recipes[0]))
+        self.assertEqual(
+            [relations.is_subscribed(author) for author in self.authors],
+            [True, False, False]
+        )
+
+    def test_users(self):
+        for limit in (2, 4):
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/users/', {'limit': limit})
+            flags = {
+                user['id']: user['is_subscribed']
+                for user in response.data['results']
+            }
+            self.assertEqual(len(flags), limit)
+            for author in self.authors:
+                if author.pk in flags:
+                    self.assertEqual(
+                        flags[author.pk], author == self.authors[0]
+                    )
+        response = self.client.get(f'/api/users/{self.authors[0].pk}/')
+        self.assertTrue(response.data['is_subscribed'])
+        response = self.client.get('/api/users/me/')
+        self.assertFalse(response.data['is_subscribed'])
+        response = self.anonymous.get(f'/api/users/{self.authors[0].pk}/')
+        self.assertFalse(response.data['is_subscribed'])
+
+
+class AnonymousCacheTest(APITestCase):
+    """
+    Кэш ответов анонимным пользователям и его сброс.
+    """
+
+    def get(self, url):
+        response = self.anonymous.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache']
+
+    def test_hit_and_miss(self):
+        reset_stats()
+        # Детали рецепта до кэша считают штамп ETag: три запроса.
+        for url, queries in (('/api/recipes/', 0),
+                             (f'/api/recipes/{self.recipes[0].pk}/', 3)):
+            self.assertEqual(self.get(url), 'MISS')
+            with self.assertNumQueries(queries):
+                self.assertEqual(self.get(url), 'HIT')
+        self.assertEqual(self.get('/api/recipes/?limit=3'), 'MISS')
+        self.assertEqual(self.get('/api/recipes/?limit=3'), 'HIT')
+        self.assertEqual(get_stats(), {HIT: 3, MISS: 3})
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Cache', response)
+
+    def test_invalidation(self):
+        recipe = self.recipes[3]
+        url = f'/api/recipes/{recipe.pk}/'
+        self.assertEqual(self.get(url), 'MISS')
+        writes = (
+            lambda: Recipe.objects.get(pk=recipe.pk).save(),
+            lambda: self.tags[0].save(),
+            lambda: IngredientRecipe.objects.filter(recipe=recipe).first(
+            ).delete(),
+            lambda: recipe.tags.remove(self.tags[0]),
+            lambda: User.objects.filter(pk=recipe.author_id).first().save(),
+        )
+        for write in writes:
+            self.assertEqual(self.get(url), 'HIT')
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            self.assertEqual(self.get(url), 'MISS')
+
+    def test_counter_ordering(self):
+        url = '/api/recipes/?ordering=-favorites_count'
+        self.assertEqual(self.get(url), 'MISS')
+        self.assertEqual(self.get(url), 'HIT')
+        recipe = self.recipes[-1]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+            self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+            self.client.post(
+                '/api/recipes/favorite/', {'recipes': [recipe.pk]},
+                format='json'
+            )
+        self.assertEqual(self.get(url), 'MISS')
+        response = self.anonymous.get(url)
+        self.assertEqual(response.data['results'][0]['id'], recipe.pk)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                '/api/recipes/favorite/', {'recipes': [recipe.pk]},
+                format='json'
+            )
+        self.assertEqual(self.get(url), 'MISS')
+
+    def test_load_data(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        self.assertEqual(self.get(url), 'MISS')
+        self.assertEqual(self.get(url), 'HIT')
+        path = os.path.join(MEDIA_ROOT, 'ingredients.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('соль,г\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_data', 'ingredients', '--path', path,
+                         stdout=io.StringIO())
+        self.assertEqual(self.get(url), 'MISS')
+
+
+class ConditionalGetTest(APITestCase):
+    """
+    ETag справочников и рецепта считается по БД: 304 для неизменных
+    данных и новый ETag после любой записи, в том числе bulk_create.
+    """
+
+    def assert_not_modified(self, client, url, etag, queries):
+        with self.assertNumQueries(queries):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def assert_changed(self, client, url, etag):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_catalog(self):
+        url = '/api/tags/'
+        response = self.anonymous.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assert_not_modified(self.anonymous, url, etag, 1)
+        Tag.objects.bulk_create([
+            Tag(name='Новый', slug='new', color='#00FF00')
+        ])
+        etag = self.assert_changed(self.anonymous, url, etag)
+        self.assert_not_modified(self.anonymous, url, etag, 1)
+        tag = Tag.objects.get(slug='new')
+        tag.name = 'Переименованный'
+        tag.save()
+        etag = self.assert_changed(self.anonymous, url, etag)
+        tag.delete()
+        self.assert_changed(self.anonymous, url, etag)
+
+    def test_if_modified_since_alone(self):
+        response = self.anonymous.get('/api/ingredients/')
+        response = self.anonymous.get(
+            '/api/ingredients/',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe(self):
+        recipe = self.recipes[2]
+        url = f'/api/recipes/{recipe.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assert_not_modified(self.client, url, etag, 3)
+        self.assertEqual(
+            self.client.post(f'{url}favorite/').status_code, 201
+        )
+        etag = self.assert_changed(self.client, url, etag)
+        Follow.objects.create(user=self.user, author=recipe.author)
+        etag = self.assert_changed(self.client, url, etag)
+        Ingredient.objects.bulk_create([
+            Ingredient(name='соль', measurement_unit='г')
+        ])
+        self.assert_changed(self.client, url, etag)
+        self.assertEqual(
+            self.client.get(
+                '/api/recipes/0/', HTTP_IF_NONE_MATCH=etag
+            ).status_code, 404
+        )
+
+
+class SearchTest(APITestCase):
+    """
+    Полнотекстовый поиск: релевантность, префиксы, все слова запроса.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.borscht = Recipe.objects.create(
+            author=self.authors[0], name='Борщ украинский',
+            text='Свекла, капуста и картофель', cooking_time=60,
+            image='recipes/images/test.png'
+        )
+        self.salad = Recipe.objects.create(
+            author=self.authors[1], name='Салат из свеклы',
+            text='Готовится из того же, что и борщ', cooking_time=15,
+            image='recipes/images/test.png'
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, 'limit': 50, **params}
+        )
+        self.assertEqual(response.status_code, 200, query)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_relevance(self):
+        self.assertEqual(
+            self.search('борщ'), [self.borscht.id, self.salad.id]
+        )
+
+    def test_prefix(self):
+        self.assertEqual(
+            self.search('укра'), [self.borscht.id]
+        )
+        self.assertCountEqual(
+            self.search('свек'), [self.borscht.id, self.salad.id]
+        )
+
+    def test_all_terms(self):
+        self.assertEqual(self.search('борщ капуста'), [self.borscht.id])
+        self.assertEqual(self.search('борщ ананас'), [])
+
+    def test_punctuation_only(self):
+        for query in ('!', '"', '*', '"*" !'):
+            self.assertEqual(self.search(query), [])
+            self.assertEqual(self.search(query, cursor=''), [])
+
+    def test_cursor(self):
+        for number in range(20):
+            Recipe.objects.create(
+                author=self.authors[2],
+                name=f'Суп {number}' if number % 2 else f'Блюдо {number}',
+                text=' '.join(['суп'] * (number % 3 + 1)),
+                cooking_time=10, image='recipes/images/test.png'
+            )
+        expected = self.search('суп')
+        self.assertEqual(len(expected), 20)
+        seen = []
+        response = self.client.get(
+            '/api/recipes/', {'search': 'суп', 'cursor': '', 'limit': 3}
+        )
+        while True:
+            seen += [recipe['id'] for recipe in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+
+
+@override_settings(FEED_STRATEGY='write', FEED_FANOUT_MAX_FOLLOWERS=1,
+                   FEED_TIMELINE_LENGTH=5)
+class FeedTest(APITestCase):
+    """
+    Лента подписок в режиме fan-out-on-write: рассылка по лентам,
+    порог подписчиков, обрезка и пересборка лент. Лента хранит
+    только последние FEED_TIMELINE_LENGTH записей, поэтому с чтением
+    по подпискам сравнивается первая страница этой длины.
+    """
+
+    def create_recipe(self, author):
+        return Recipe.objects.create(
+            author=author, name='Новый рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/test.png'
+        )
+
+    def timeline(self, user=None):
+        return list(TimelineEntry.objects.filter(
+            user=user or self.user
+        ).order_by('-pub_date', '-recipe_id').values_list(
+            'recipe_id', flat=True
+        ))
+
+    def feed(self, limit=50):
+        response = self.client.get('/api/recipes/feed/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def expected(self, limit=50):
+        return list(Recipe.objects.filter(
+            author__following__user=self.user
+        ).order_by('-pub_date', '-id').values_list('id', flat=True)[:limit])
+
+    def test_fan_out(self):
+        self.assertEqual(self.timeline(), self.expected(5))
+        author = self.authors[1]
+        Follow.objects.create(user=self.user, author=author)
+        self.assertEqual(self.timeline(), self.expected(5))
+        recipe = self.create_recipe(author)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.fanned_out)
+        self.assertEqual(self.timeline()[0], recipe.pk)
+        self.assertEqual(self.timeline(), self.expected(5))
+        self.assertEqual(self.feed(5), self.expected(5))
+
+    def test_popular_author(self):
+        Follow.objects.create(user=self.authors[1], author=self.authors[0])
+        recipe = self.create_recipe(self.authors[0])
+        recipe.refresh_from_db()
+        self.assertFalse(recipe.fanned_out)
+        self.assertFalse(TimelineEntry.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.feed(5), self.expected(5))
+        self.assertEqual(self.feed(5)[0], recipe.pk)
+
+    def test_trim_and_unfollow(self):
+        author = self.authors[2]
+        Follow.objects.create(user=self.user, author=author)
+        recipes = [self.create_recipe(author).pk for _ in range(7)]
+        self.assertEqual(self.timeline(), recipes[::-1][:5])
+        self.assertEqual(self.feed(5), self.expected(5))
+        self.client.delete(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(self.timeline(), [])
+        self.client.post(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(self.timeline(), recipes[::-1][:5])
+
+    def test_rebuild(self):
+        Follow.objects.create(user=self.user, author=self.authors[1])
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=io.StringIO())
+        self.assertEqual(self.timeline(), self.expected(5))
+        self.assertEqual(self.feed(5), self.expected(5))
+        with override_settings(FEED_STRATEGY='read'):
+            call_command('rebuild_timelines', stdout=io.StringIO())
+            self.assertEqual(self.timeline(), [])
+            self.assertEqual(self.feed(), self.expected())
+
+
+class ShoppingListFormatTest(APITestCase):
+    """
+    Выгрузка списка покупок в PDF, TXT, CSV и JSON
+    по ?format= и по заголовку Accept.
+    """
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.lines = [
+            {'name': f'ингредиент {number}', 'measurement_unit': 'г',
+             'total_amount': number}
+            for number in range(1, 6)
+        ]
+
+    def assert_attachment(self, response, extension):
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_list.{extension}"'
+        )
+
+    def test_pdf(self):
+        for params, headers in (({}, {}), ({'format': 'pdf'}, {}),
+                                ({}, {'HTTP_ACCEPT': 'application/pdf'})):
+            response = self.client.get(self.url, params, **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertIn('shopping_list.pdf', response['Content-Disposition'])
+            self.assertTrue(
+                b''.join(response.streaming_content).startswith(b'%PDF')
+            )
+        self.assertIsNotNone(cache.get(get_cache_key(self.lines)))
+
+    def test_text(self):
+        response = self.client.get(self.url, {'format': 'txt'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assert_attachment(response, 'txt')
+        self.assertEqual(
+            response.content.decode().splitlines(),
+            [f"{line['name']} - {line['total_amount']} г"
+             for line in self.lines]
+        )
+
+    def test_csv(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assert_attachment(response, 'csv')
+        rows = list(csv.reader(io.StringIO(response.content.decode())))
+        self.assertEqual(rows[0], ['name', 'measurement_unit', 'total_amount'])
+        self.assertEqual(rows[1:], [
+            [line['name'], 'г', str(line['total_amount'])]
+            for line in self.lines
+        ])
+
+    def test_json(self):
+        for params, headers in (({'format': 'json'}, {}),
+                                ({}, {'HTTP_ACCEPT': 'application/json'})):
+            response = self.client.get(self.url, params, **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertNotIn('Content-Disposition', response)
+            self.assertEqual(response.json(), self.lines)
+
+    def test_errors(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='image/png')
+        self.assertEqual(response.status_code, 406)
+        response = self.anonymous.get(self.url, {'format': 'csv'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+class OffloadTest(SimpleTestCase):
+    """
+    Долгая выгрузка в пуле не блокирует остальные запросы воркера.
+    """
+
+    def run_requests(self, export_view, other_view):
+        factory = RequestFactory()
+
+        async def requests():
+            export = asyncio.ensure_future(export_view(factory.get('/')))
+            await asyncio.sleep(0.05)
+            await other_view(factory.get('/'))
+            await export
+
+        async_to_sync(requests)()
+
+    def test_concurrent_requests(self):
+        finished = []
+
+        def export_view(request):
+            time.sleep(0.3)
+            finished.append('export')
+            return HttpResponse()
+
+        def other_view(request):
+            finished.append('other')
+            return HttpResponse()
+
+        self.run_requests(
+            sync_to_async(export_view), sync_to_async(other_view)
+        )
+        self.assertEqual(finished, ['export', 'other'])
+        finished.clear()
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        self.run_requests(
+            offload(export_view, executor),
+            offload(other_view, executor, methods={'POST'})
+        )
+        self.assertEqual(finished, ['other', 'export'])
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True)
+class AsyncInstrumentationTest(APITestCase):
+    """
+    Замеры работают и в асинхронной цепочке обработчиков.
+    """
+
+    def test_server_timing(self):
+        # Соединение теста открыто до загрузки middleware, поэтому
+        # счетчик к нему подключается явно, а не по connection_created.
+        install_query_counting()
+
+        async def request():
+            return await self.async_client.get('/api/tags/')
+
+        with CaptureQueriesContext(connection) as context:
+            response = async_to_sync(request)()
+        self.assertEqual(response.status_code, 200)
+        queries = re.search(r'(\d+) queries', response['Server-Timing'])
+        self.assertEqual(int(queries.group(1)), len(context))
+
+
+class SerializerTimingTest(APITestCase):
+    """
+    Время сериализации считает примесь TimedSerializerMixin,
+    классы DRF не подменяются.
+    """
+
+    def test_serializer_timing(self):
+        request = RequestFactory().get('/api/recipes/')
+        request.user = self.user
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            serializer = RecipeSerializer(
+                Recipe.objects.with_related(self.user)[:10], many=True,
+                context={'request': request}
+            )
+            self.assertIsInstance(serializer, TimedListSerializer)
+            self.assertEqual(len(serializer.data), 10)
+        finally:
+            current_metrics.reset(token)
+        self.assertGreater(metrics.serializer_time, 0)
+        self.assertEqual(metrics.serializer_depth, 0)
+        self.assertNotIsInstance(
+            ListSerializer(child=TagSerializer()), TimedSerializerMixin
+        )
+
+
+# Маршруты API с вынесенными в пулы вью, как под ASGI.
+urlpatterns = [
+    path('api/', include((offload_urls(router.urls, OFFLOADED), 'api'))),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class OffloadedEndpointTest(TransactionTestCase):
+    """
+    Выгрузка списка покупок под ASGI выполняется в пуле export:
+    у потока пула свое соединение, поэтому данные коммитятся
+    (TransactionTestCase).
+    """
+
+    def setUp(self):
+        user = User.objects.create_user(
+            username='buyer', email='buyer@example.com',
+            first_name='Покупатель', last_name='Тестовый', password='pass'
+        )
+        self.token = Token.objects.create(user=user).key
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=user, name='Суп', text='Описание', cooking_time=10,
+            image='recipes/images/test.png'
+        )
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=salt, amount=5
+        )
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    def test_download(self):
+        threads = []
+
+        def record_thread(cart):
+            threads.append(threading.current_thread().name)
+            return fold_units(cart)
+
+        async def request():
+            return await self.async_client.get(
+                '/api/recipes/download_shopping_cart/?format=json',
+                AUTHORIZATION=f'Token {self.token}'
+            )
+
+        with mock.patch('api.views.fold_units', record_thread):
+            response = async_to_sync(request)()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [
+            {'name': 'соль', 'measurement_unit': 'г', 'total_amount': 5}
+        ])
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('export'), threads)
+
+
+def make_png(width, height, noise=False):
+    """
+    PNG из случайных пикселей почти не сжимается.
+    """
+    if noise:
+        image = Image.frombytes(
+            'RGB', (width, height), os.urandom(width * height * 3)
+        )
+    else:
+        image = Image.new('RGB', (width, height), 'red')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def make_data_url(content):
+    return 'data:image/png;base64,' + base64.b64encode(content).decode()
+
+
+class ImageFieldTest(SimpleTestCase):
+    """
+    Картинка декодируется кусками, ограничения одинаковы
+    для data URL и загруженного файла.
+    """
+
+    def assert_error(self, field, data, code):
+        with self.assertRaises(ValidationError) as context:
+            field.to_internal_value(data)
+        self.assertEqual(context.exception.detail[0].code, code)
+
+    def test_large_data_url_memory(self):
+        content = make_png(1500, 1000, noise=True)
+        data = make_data_url(content)
+        field = StreamingBase64ImageField()
+        # Первый вызов импортирует плагины Pillow, это не в счет.
+        field.to_internal_value(make_data_url(make_png(10, 10))).close()
+        tracemalloc.start()
+        try:
+            file = field.to_internal_value(data)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.addCleanup(file.close)
+        self.assertEqual(file.size, len(content))
+        self.assertLess(peak, len(content) // 10)
+
+    def test_invalid_base64(self):
+        field = StreamingBase64ImageField()
+        for payload in ('éééééééé', 'a!b?', 'abc'):
+            self.assert_error(
+                field, f'data:image/png;base64,{payload}', 'invalid_base64'
+            )
+
+    def test_limits(self):
+        content = make_png(200, 50)
+        field = StreamingBase64ImageField(max_bytes=len(content) - 1)
+        self.assert_error(field, make_data_url(content), 'too_large')
+        self.assert_error(
+            field,
+            SimpleUploadedFile('image.png', content, 'image/png'),
+            'too_large'
+        )
+        field = StreamingBase64ImageField(max_side=100)
+        self.assert_error(field, make_data_url(content), 'too_big_dimensions')
+        self.assert_error(
+            field,
+            SimpleUploadedFile('image.png', content, 'image/png'),
+            'too_big_dimensions'
+        )
+        field = StreamingBase64ImageField(max_side=200)
+        upload = SimpleUploadedFile('image.png', content, 'image/png')
+        self.assertIs(field.to_internal_value(upload), upload)
+
+
+class RecipeWriteQueriesTest(APITestCase):
+    """
+    Число запросов при создании и правке рецепта не зависит
+    от числа ингредиентов.
+    """
+
+    def recipe_data(self, ingredients, **fields):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': make_data_url(make_png(10, 10)),
+            'tags': [tag.pk for tag in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in ingredients
+            ],
+            **fields
+        }
+
+    def test_create(self):
+        for count in (1, 5, 30):
+            with self.assertNumQueries(13):
+                response = self.client.post(
+                    '/api/recipes/',
+                    self.recipe_data(self.ingredients[:count]),
+                    format='json'
+                )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['ingredients']), count)
+
+    def written_tables(self, context):
+        """
+        (команда, таблица) каждого изменяющего запроса.
+        """
+        writes = []
+        for query in context.captured_queries:
+            match = re.match(
+                r'(INSERT|UPDATE|DELETE)\b.*?"(\w+)"', query['sql']
+            )
+            if match:
+                writes.append(match.groups())
+        return writes
+
+    def edit(self, recipe, **fields):
+        client = APIClient()
+        client.force_authenticate(recipe.author)
+        data = {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'tags': [tag.pk for tag in recipe.tags.all()],
+            'ingredients': [
+                {'id': row.ingredient_id, 'amount': row.amount}
+                for row in recipe.ingridients_recipe.order_by('id')
+            ],
+            **fields
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = client.patch(
+                f'/api/recipes/{recipe.pk}/', data, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return response, self.written_tables(context)
+
+    def test_no_op_edit(self):
+        recipe = self.recipes[0]
+        for fields in ({}, {'name': 'Новое название'}):
+            response, writes = self.edit(recipe, **fields)
+            self.assertEqual(writes, [('UPDATE', 'recipes_recipe')])
+
+    def test_single_field_edits(self):
+        recipe = self.recipes[0]
+        rows = list(recipe.ingridients_recipe.order_by('id'))
+        ingredients = [
+            {'id': row.ingredient_id, 'amount': row.amount} for row in rows
+        ]
+        ingredients[0]['amount'] = 100
+        response, writes = self.edit(recipe, ingredients=ingredients)
+        self.assertEqual(writes, [
+            ('UPDATE', 'recipes_ingredientrecipe'),
+            ('UPDATE', 'recipes_recipe'),
+        ])
+        self.assertIn(100, [
+            ingredient['amount']
+            for ingredient in response.data['ingredients']
+        ])
+        response, writes = self.edit(
+            recipe,
+            ingredients=ingredients + [{'id': self.ingredients[-1].pk,
+                                        'amount': 1}]
+        )
+        self.assertEqual(writes, [
+            ('INSERT', 'recipes_ingredientrecipe'),
+            ('UPDATE', 'recipes_recipe'),
+        ])
+        response, writes = self.edit(recipe, ingredients=ingredients[1:])
+        self.assertEqual(writes, [
+            ('DELETE', 'recipes_ingredientrecipe'),
+            ('UPDATE', 'recipes_recipe'),
+        ])
+        response, writes = self.edit(recipe, tags=[self.tags[1].pk])
+        self.assertEqual(writes, [
+            ('UPDATE', 'recipes_recipe'),
+            ('DELETE', 'recipes_recipe_tags'),
+            ('INSERT', 'recipes_recipe_tags'),
+        ])
+
+
+class CounterTest(APITestCase):
+    """
+    Счетчики favorites_count и carts_count совпадают с числом строк
+    при одиночных, массовых и каскадных изменениях.
+    """
+
+    def counters(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.favorites_count, recipe.carts_count
+
+    def assert_live(self):
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                (recipe.favorites_count, recipe.carts_count),
+                (recipe.in_favorite.count(), recipe.cart.count()),
+                recipe.pk
+            )
+
+    def test_single(self):
+        recipe = self.recipes[7]
+        url = f'/api/recipes/{recipe.pk}/'
+        self.client.post(f'{url}favorite/')
+        self.client.post(f'{url}shopping_cart/')
+        self.client.post(f'{url}favorite/')
+        self.assertEqual(self.counters(recipe), (1, 1))
+        self.client.delete(f'{url}favorite/')
+        self.client.delete(f'{url}favorite/')
+        self.assertEqual(self.counters(recipe), (0, 1))
+        self.client.delete(f'{url}shopping_cart/')
+        self.assertEqual(self.counters(recipe), (0, 0))
+        self.assert_live()
+
+    def test_bulk(self):
+        recipe_ids = [recipe.pk for recipe in self.recipes[:6]]
+        self.client.post(
+            '/api/recipes/favorite/', {'recipes': recipe_ids}, format='json'
+        )
+        self.client.put(
+            '/api/recipes/shopping_cart/', {'recipes': recipe_ids[3:]},
+            format='json'
+        )
+        self.assertEqual(self.counters(self.recipes[1]), (1, 0))
+        self.assertEqual(self.counters(self.recipes[4]), (1, 1))
+        self.client.delete(
+            '/api/recipes/favorite/', {'recipes': recipe_ids[:3]},
+            format='json'
+        )
+        self.assertEqual(self.counters(self.recipes[0]), (0, 0))
+        self.assert_live()
+
+    def test_user_delete(self):
+        other = self.authors[2]
+        Favorite.objects.create(user=other, recipe=self.recipes[0])
+        ShoppingCart.objects.create(user=other, recipe=self.recipes[1])
+        self.assertEqual(self.counters(self.recipes[0]), (2, 0))
+        self.user.delete()
+        self.assertEqual(self.counters(self.recipes[0]), (1, 0))
+        self.assertEqual(self.counters(self.recipes[1]), (0, 1))
+        self.assert_live()
+
+    def test_ordering_and_rebuild(self):
+        for author in self.authors:
+            Favorite.objects.create(user=author, recipe=self.recipes[9])
+        response = self.anonymous.get(
+            '/api/recipes/', {'ordering': '-favorites_count'}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results'][:2]],
+            [self.recipes[9].pk, self.recipes[0].pk]
+        )
+        Recipe.objects.update(favorites_count=0, carts_count=5)
+        call_command('rebuild_recipe_counters', stdout=io.StringIO())
+        self.assert_live()
+
+
+class BulkTest(APITestCase):
+    """
+    Массовые изменения учитывают в счетчиках и агрегате корзины
+    только действительно вставленные и удаленные строки.
+    """
+
+    def assert_consistent(self):
+        self.assertEqual(carts.get_stored_totals(), carts.get_live_totals())
+        for recipe in Recipe.objects.all():
+            self.assertEqual(recipe.carts_count, recipe.cart.count())
+            self.assertEqual(
+                recipe.favorites_count, recipe.in_favorite.count()
+            )
+
+    def test_add_remove_sync(self):
+        recipe_ids = [recipe.pk for recipe in self.recipes[:5]]
+        for url in ('/api/recipes/shopping_cart/', '/api/recipes/favorite/'):
+            response = self.client.post(
+                url, {'recipes': recipe_ids}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['added']), 4)
+            self.assert_consistent()
+            response = self.client.delete(
+                url, {'recipes': recipe_ids[:2]}, format='json'
+            )
+            self.assertEqual(
+                [recipe['id'] for recipe in response.data['removed']],
+                recipe_ids[:2]
+            )
+            self.assert_consistent()
+            response = self.client.put(
+                url, {'recipes': recipe_ids[1:3]}, format='json'
+            )
+            self.assertEqual(
+                [recipe['id'] for recipe in response.data['added']],
+                recipe_ids[1:2]
+            )
+            self.assert_consistent()
+
+    def test_concurrent_add(self):
+        """
+        Строка, вставленная параллельным запросом после чтения
+        текущего набора, не учитывается второй раз.
+        """
+        recipe = self.recipes[1]
+        self.assertEqual(
+            bulk.write(ShoppingCart, self.user.pk, [recipe.pk], []),
+            ([], [])
+        )
+        self.assert_consistent()
+        self.assertEqual(
+            bulk.write(
+                ShoppingCart, self.user.pk, [], [recipe.pk, recipe.pk]
+            ),
+            ([], [recipe.pk])
+        )
+        self.assert_consistent()
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-
+from .offload import export_executor, offload_urls, upload_executor
 from .views import (
     CustomUserViewSet,
     IngredientViewSet,
@@ -18,8 +19,23 @@ router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet, basename='tags')
 
+# Под ASGI тяжелые эндпоинты (PDF, декодирование base64-картинок)
+# выполняются в ограниченных пулах потоков, см. api.offload. Под WSGI
+# вью остаются синхронными: пулы там не дают ничего, кроме накладных
+# расходов на каждый запрос.
+OFFLOADED = {
+    'recipes-download-shopping-cart': (export_executor, None),
+    'recipes-list': (upload_executor, {'POST'}),
+    'recipes-detail': (upload_executor, {'PUT', 'PATCH'}),
+}
+
+if settings.OFFLOAD_VIEWS:
+    api_urls = offload_urls(router.urls, OFFLOADED)
+else:
+    api_urls = router.urls
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(api_urls)),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
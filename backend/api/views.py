@@ -1,27 +1,46 @@
-﻿from django.db.models import Sum
+﻿from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Value)
+from django.db.transaction import atomic
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from django.contrib.auth.hashers import make_password
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import (
     SAFE_METHODS, AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from .filters import RecipeFilterSet
-from .paginator import PagePaginator
+from .cache import (COUNTER_MODELS, RECIPE_MODELS, AnonymousCacheMixin,
+                    CatalogConditionalMixin, ConditionalGetMixin, bump_version,
+                    get_catalog_stamp)
+from .exports import FILENAME, shopping_list_response
+from .filters import RecipeFilterSet, RecipeSearchFilter
+from .paginator import FeedPaginator, KeysetPagePaginator
+from .parsers import LimitedJSONParser
 from .permissions import IsAuthorOrAdminOrReadOnly
-from .serializers import (CreateRecipeSerializer, CustomUserSerializer,
-                          FavoriteSerializer, FollowSerializer,
-                          IngredientSerializer, RecipeSerializer,
-                          ShoppingCartSerializer, TagSerializer)
-from .utils import generate_pdf
-
-from recipes.models import (Favorite, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .serializers import (BulkResultSerializer, CartIngredientSerializer,
+                          CreateRecipeSerializer, CustomUserSerializer,
+                          FavoriteSerializer, FollowListSerializer,
+                          FollowSerializer, IngredientSerializer,
+                          RecipeIdsSerializer, RecipeSerializer,
+                          RecipeSetSerializer, ShoppingCartSerializer,
+                          TagSerializer)
+
+from recipes import bulk
+from recipes.autocomplete import ingredient_index
+from recipes.feed import get_page as get_feed_page
+from recipes.models import (CartIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from recipes.units import fold_units
 from users.models import Follow, User
 
 
@@ -31,7 +50,12 @@ class CustomUserViewSet(UserViewSet):
     """
     permission_classes = [IsAuthorOrAdminOrReadOnly]
     serializer_class = CustomUserSerializer
-    pagination_class = PagePaginator
+    pagination_class = KeysetPagePaginator
+
+    def get_keyset_ordering(self):
+        if self.action == 'subscriptions':
+            return ('follow_id',)
+        return None
 
     def perform_create(self, serializer):
         hash_pwd = make_password(serializer.validated_data.get('password'))
@@ -49,15 +73,15 @@ class CustomUserViewSet(UserViewSet):
                 'errors': "Нельзя подписаться на самого себя"
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        if Follow.objects.filter(user=request.user,
-                                 author=author).exists():
+        try:
+            with atomic():
+                follow = Follow.objects.create(
+                    user=request.user, author=author
+                )
+        except IntegrityError:
             return Response({
                 'errors': "Нельзя подписаться дважды"
             }, status=status.HTTP_400_BAD_REQUEST)
-
-        follow = Follow.objects.create(
-            user=request.user, author=author
-        )
         serializer = FollowSerializer(
             follow, context={'request': request}
         )
@@ -67,71 +91,226 @@ class CustomUserViewSet(UserViewSet):
     def delete_subscribe(self, request, id=None):
         """Функции отписки от автора."""
 
-        author = get_object_or_404(User, pk=id)
-
-        if request.user == author:
+        if str(request.user.pk) == str(id):
             return Response({
                 'errors': "Нельзя отписаться от самого себя"
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        subscribe = Follow.objects.filter(user=request.user, author=author)
+        deleted, _ = Follow.objects.filter(
+            user=request.user, author_id=id
+        ).delete()
 
-        if not subscribe.exists():
+        if not deleted:
+            get_object_or_404(User, pk=id)
             return Response({
                 'errors': "Вы не были подписаны на этого пользователя"
             }, status=status.HTTP_400_BAD_REQUEST)
-        subscribe.delete()
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=['get'], detail=False,
             permission_classes=[IsAuthenticated], url_path='subscriptions')
     def subscriptions(self, request):
-        subscriptions = Follow.objects.filter(user=request.user)
-        page = self.paginate_queryset(subscriptions)
-        serializer = FollowSerializer(page, many=True,
-                                      context={'request': request})
+        """
+        Авторы, на которых подписан пользователь, с превью рецептов.
+        Число запросов не зависит от размера страницы: количество
+        рецептов аннотируется, превью берутся одним оконным запросом.
+        """
+        authors = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            follow_id=F('following__id'),
+            recipes_count=Count('recipes'),
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('follow_id')
+        page = self.paginate_queryset(authors)
+        recipes_limit = request.query_params.get('recipes_limit')
+        previews = Recipe.objects.latest_by_authors(
+            page, int(recipes_limit) if recipes_limit else None
+        )
+        for author in page:
+            author.recipe_previews = previews[author.pk]
+        serializer = FollowListSerializer(page, many=True,
+                                          context={'request': request})
 
         return self.get_paginated_response(serializer.data)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin, ModelViewSet):
     """
     Вьюсет обработки моделей рецептов.
+    Ответы анонимным пользователям кэшируются,
+    рецепт поддерживает условные запросы по ETag.
     """
+    cache_models = RECIPE_MODELS
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (
+        DjangoFilterBackend, RecipeSearchFilter, OrderingFilter
+    )
     filterset_class = RecipeFilterSet
-    pagination_class = PagePaginator
+    ordering_fields = ('pub_date', 'favorites_count', 'carts_count')
+    pagination_class = KeysetPagePaginator
+    parser_classes = (LimitedJSONParser, FormParser, MultiPartParser)
     permission_classes = (IsAuthorOrAdminOrReadOnly, IsAuthenticatedOrReadOnly)
 
+    def get_queryset(self):
+        return Recipe.objects.with_related(self.request.user)
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return CreateRecipeSerializer
 
+    def get_ordering_param(self):
+        """
+        Поле сортировки из ?ordering=, если оно разрешено.
+        """
+        ordering = self.request.query_params.get(
+            OrderingFilter.ordering_param, ''
+        ).strip()
+        if ordering.lstrip('-') in self.ordering_fields:
+            return ordering
+        return None
+
+    def get_cache_models(self, request):
+        """
+        Сортировка по счетчикам зависит от избранного и списков покупок.
+        """
+        if self.get_ordering_param() in (None, 'pub_date', '-pub_date'):
+            return self.cache_models
+        return self.cache_models + COUNTER_MODELS
+
+    def get_keyset_ordering(self):
+        ordering = self.get_ordering_param()
+        if ordering is not None:
+            return (ordering, '-id')
+        if RecipeSearchFilter().get_search_query(self.request):
+            return ('-search_rank', '-id')
+        return ('-pub_date', '-id')
+
+    def get_stamp(self, request, *args, **kwargs):
+        """
+        Штамп рецепта считается по БД одним запросом: время изменения
+        и счетчики рецепта, данные автора, а для авторизованного
+        пользователя - флаги избранного, корзины и подписки.
+        К нему добавляются штампы справочников тегов и ингредиентов.
+        """
+        user = request.user
+        fields = (
+            'pub_date', 'updated_at', 'favorites_count', 'carts_count',
+            'author__email', 'author__username', 'author__first_name',
+            'author__last_name'
+        )
+        try:
+            queryset = Recipe.objects.filter(pk=kwargs['pk'])
+        except (TypeError, ValueError):
+            return None
+        if user.is_authenticated:
+            queryset = queryset.with_user_flags(user).annotate(
+                is_subscribed=Exists(Follow.objects.filter(
+                    user=user, author=OuterRef('author')
+                ))
+            )
+            fields += ('is_favorited', 'is_in_shopping_cart', 'is_subscribed')
+        recipe = queryset.values(*fields).first()
+        if recipe is None:
+            return None
+        tags, tags_modified = get_catalog_stamp(Tag)
+        ingredients, ingredients_modified = get_catalog_stamp(Ingredient)
+        return (
+            (kwargs['pk'], user.pk, tuple(recipe.values()), tags, ingredients),
+            max(recipe['updated_at'].timestamp(), tags_modified,
+                ingredients_modified)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_feed_keys(self, position, limit):
+        return get_feed_page(self.request.user.pk, position, limit)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPaginator
+    )
+    def feed(self, request):
+        """
+        Лента: рецепты авторов из подписок пользователя, новые сверху.
+        Постраничная навигация только курсором (?cursor=).
+        """
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = RecipeSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
     @staticmethod
     def post_method_for_actions(request, pk, serializers):
-        data = {
-            'user': request.user.id,
-            'recipe': pk
-        }
-        serializer = serializers(data=data, context={
+        serializer = serializers(data={'recipe': pk}, context={
             'request': request
         })
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(user=request.user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
     def delete_method_for_actions(request, pk, model):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        model_instance = get_object_or_404(model, user=user, recipe=recipe)
-        model_instance.delete()
+        deleted, _ = model.objects.filter(
+            user=request.user, recipe_id=pk
+        ).delete()
+        if not deleted:
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def bulk_method_for_actions(request, model):
+        """
+        Массовая операция со связями пользователя и рецептов:
+        POST добавляет рецепты из списка, DELETE убирает их,
+        PUT делает набор равным списку. Тело: {"recipes": [id, ...]}.
+        """
+        if request.method == 'PUT':
+            serializer = RecipeSetSerializer(data=request.data)
+        else:
+            serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = {
+            recipe.pk: recipe
+            for recipe in serializer.validated_data['recipes']
+        }
+        if request.method == 'POST':
+            added, removed = bulk.change(model, request.user.pk, add=recipes)
+        elif request.method == 'DELETE':
+            added, removed = bulk.change(
+                model, request.user.pk, remove=recipes
+            )
+        else:
+            added, removed = bulk.sync(model, request.user.pk, recipes)
+        if added or removed:
+            transaction.on_commit(lambda: bump_version(model))
+        missing = [pk for pk in removed if pk not in recipes]
+        if missing:
+            recipes.update(Recipe.objects.in_bulk(missing))
+        return Response(BulkResultSerializer({
+            'added': [recipes[pk] for pk in added],
+            'removed': [recipes[pk] for pk in removed],
+        }, context={'request': request}).data)
+
+    @action(
+        methods=['post', 'put', 'delete'],
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_method_for_actions(request, ShoppingCart)
+
     @action(
         methods=['post'],
         detail=True
@@ -149,25 +328,48 @@ class RecipeViewSet(ModelViewSet):
     @action(
         methods=['get'],
         detail=False,
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(PDFRenderer, PlainTextRenderer,
+                          CSVRenderer, JSONRenderer)
     )
     def download_shopping_cart(self, request):
-        cart = IngredientRecipe.objects.filter(
-            recipe__cart__user=request.user
+        """
+        Выгрузка списка покупок.
+        Формат выбирается параметром ?format= (pdf, txt, csv, json)
+        или заголовком Accept, по умолчанию PDF.
+        """
+        cart = fold_units(CartIngredient.objects.filter(
+            user=request.user
         ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            Sum('amount')
-        )
-        cart_txt = []
-        for item in cart:
-            cart_txt.append(
-                item['ingredient__name'] + ' - '
-                + str(item['amount__sum']) + ' '
-                + item['ingredient__measurement_unit']
+            'total_amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        ).order_by('name', 'measurement_unit'))
+        export_format = request.accepted_renderer.format
+        if export_format == PDFRenderer.format:
+            return shopping_list_response(cart)
+        headers = {}
+        if export_format != JSONRenderer.format:
+            headers['Content-Disposition'] = (
+                f'attachment; filename="{FILENAME}.{export_format}"'
             )
-        return generate_pdf(cart_txt)
+        return Response(list(cart), headers=headers)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_summary(self, request):
+        """
+        Сводка списка покупок в JSON из агрегата корзины.
+        """
+        cart = CartIngredient.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient__measurement_unit'
+        )
+        return Response(CartIngredientSerializer(cart, many=True).data)
 
     @action(
         methods=['post'],
@@ -182,8 +384,18 @@ class RecipeViewSet(ModelViewSet):
         return self.delete_method_for_actions(
             request=request, pk=pk, model=Favorite)
 
+    @action(
+        methods=['post', 'put', 'delete'],
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        return self.bulk_method_for_actions(request, Favorite)
 
-class IngredientViewSet(ModelViewSet):
+
+class IngredientViewSet(CatalogConditionalMixin, ModelViewSet):
     """
     Вьюсет обработки модели продуктов.
     """
@@ -194,8 +406,24 @@ class IngredientViewSet(ModelViewSet):
     pagination_class = None
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        """
+        С параметром ?name= работает в режиме автодополнения:
+        ищет по индексу в памяти и возвращает не больше
+        INGREDIENT_AUTOCOMPLETE_LIMIT ингредиентов.
+        """
+        if 'name' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(self.autocomplete, request)
+
+    def autocomplete(self, request):
+        return Response(ingredient_index.search(
+            request.query_params['name'],
+            settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        ))
+
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(CatalogConditionalMixin, ModelViewSet):
     """
     Вьюсет обработки моделей тегов.
     Добавить тег может администратор.
@@ -0,0 +1,252 @@
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.serializers import LIST_SERIALIZER_KWARGS, ListSerializer
+
+CACHE_PREFIX = 'instrumentation'
+PROCESSES_KEY = f'{CACHE_PREFIX}:processes'
+SAMPLE_FIELDS = ('queries', 'db_ms', 'serializer_ms', 'total_ms', 'size')
+UNRESOLVED_ROUTE = '<unresolved>'
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Счетчики одного запроса. Экземпляр служит обработчиком
+    connection.execute_wrapper и считает запросы и время в БД.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Обработчик connection.execute_wrapper, постоянно подключенный
+    ко всем соединениям: передает запрос счетчикам текущего запроса,
+    если они есть. asgiref переносит current_metrics и в потоки
+    sync_to_async, поэтому считаются и запросы из пулов api.offload,
+    у которых свои соединения с БД.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def add_query_counter(connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def install_query_counting():
+    """
+    Подключает count_queries к соединениям текущего потока
+    и ко всем, которые будут открыты дальше в любом потоке.
+    """
+    connection_created.connect(
+        add_query_counter, dispatch_uid='instrumentation'
+    )
+    for connection in connections.all():
+        add_query_counter(connection)
+
+
+class TimedSerializerMixin:
+    """
+    Примесь к сериализаторам ответов: время внешнего обращения
+    к data за вычетом запросов к БД внутри него идет в serializer_time
+    текущего запроса. С many=True список создается как
+    TimedListSerializer и замеряется целиком.
+    """
+
+    @property
+    def data(self):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializer_depth:
+            return super().data
+        metrics.serializer_depth += 1
+        db_time = metrics.db_time
+        started = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_time += (
+                time.perf_counter() - started - (metrics.db_time - db_time)
+            )
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        allow_empty = kwargs.pop('allow_empty', None)
+        list_kwargs = {'child': cls(*args, **kwargs)}
+        if allow_empty is not None:
+            list_kwargs['allow_empty'] = allow_empty
+        for key in LIST_SERIALIZER_KWARGS:
+            if key in kwargs:
+                list_kwargs[key] = kwargs[key]
+        return TimedListSerializer(*args, **list_kwargs)
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    pass
+
+
+class RouteHistograms:
+    """
+    Скользящее окно последних замеров по каждому маршруту DRF
+    в памяти процесса. Периодически снимок окна пишется в кэш,
+    откуда его читает команда endpoint_stats.
+    """
+
+    def __init__(self, window, flush_interval):
+        self.window = window
+        self.flush_interval = flush_interval
+        self._lock = Lock()
+        self._samples = {}
+        self._flushed_at = 0.0
+
+    def record(self, route, sample):
+        with self._lock:
+            samples = self._samples.get(route)
+            if samples is None:
+                samples = self._samples[route] = deque(maxlen=self.window)
+            samples.append(sample)
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                route: list(samples)
+                for route, samples in self._samples.items()
+            }
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        pid = os.getpid()
+        cache.set(f'{CACHE_PREFIX}:{pid}', self.snapshot(), None)
+        processes = cache.get(PROCESSES_KEY, [])
+        if pid not in processes:
+            cache.set(PROCESSES_KEY, processes + [pid], None)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+def load_histograms():
+    """
+    Собирает снимки окон всех процессов: {маршрут: [замеры]}.
+    """
+    snapshots = cache.get_many([
+        f'{CACHE_PREFIX}:{pid}' for pid in cache.get(PROCESSES_KEY, [])
+    ])
+    merged = {}
+    for snapshot in snapshots.values():
+        for route, samples in snapshot.items():
+            merged.setdefault(route, []).extend(samples)
+    return merged
+
+
+def reset_histograms():
+    pids = cache.get(PROCESSES_KEY, [])
+    cache.delete_many(
+        [f'{CACHE_PREFIX}:{pid}' for pid in pids] + [PROCESSES_KEY]
+    )
+    histograms.clear()
+
+
+histograms = RouteHistograms(
+    window=getattr(settings, 'INSTRUMENTATION_WINDOW', 500),
+    flush_interval=getattr(settings, 'INSTRUMENTATION_FLUSH_INTERVAL', 10)
+)
+
+
+class InstrumentationMiddleware:
+    """
+    Замеряет для каждого запроса число SQL-запросов, время в БД,
+    время сериализации и размер ответа. Результат отдается
+    в заголовке Server-Timing и копится в гистограммах по маршрутам.
+    Включается настройкой INSTRUMENTATION_ENABLED. Работает и в
+    синхронной, и в асинхронной цепочке обработчиков (ASGI).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed
+        install_query_counting()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # По этой метке обработчик видит, что __call__
+            # возвращает корутину.
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.started
+        if response.streaming:
+            size = int(response.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        sample = (
+            metrics.queries,
+            metrics.db_time * 1000,
+            metrics.serializer_time * 1000,
+            total * 1000,
+            size
+        )
+        response['Server-Timing'] = (
+            f'db;dur={sample[1]:.2f};desc="{metrics.queries} queries", '
+            f'serialize;dur={sample[2]:.2f}, '
+            f'total;dur={sample[3]:.2f}, '
+            f'size;desc="{size} bytes"'
+        )
+        match = request.resolver_match
+        histograms.record(
+            match.url_name if match and match.url_name else UNRESOLVED_ROUTE,
+            sample
+        )
+        return response
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -68,6 +69,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
 
 
 # Database
@@ -88,6 +90,23 @@ DATABASES = {
     }
 }
 
+# Cache
+# LocMemCache по умолчанию, для нескольких процессов - например
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и CACHE_LOCATION=/var/tmp/foodgram_cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+API_RESPONSE_CACHE_TIMEOUT = 300
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -167,6 +186,41 @@ DJOSER = {
     }
 }
 
+# Замеры запросов к API (Server-Timing и команда endpoint_stats).
+INSTRUMENTATION_ENABLED = os.getenv(
+    'INSTRUMENTATION_ENABLED', default='False'
+) == 'True'
+INSTRUMENTATION_WINDOW = 500
+INSTRUMENTATION_FLUSH_INTERVAL = 10
+
+# Выгрузка списка покупок и сохранение рецептов в пулах потоков
+# (api.offload). Включается в foodgram.asgi: имеет смысл только
+# под ASGI-сервером.
+OFFLOAD_VIEWS = os.getenv('OFFLOAD_VIEWS', default='False') == 'True'
+EXPORT_POOL_SIZE = 2
+UPLOAD_POOL_SIZE = 4
+
+# True - уменьшенные копии картинок рецептов строятся сразу
+# в запросе, а не в фоновом потоке (recipes.images).
+IMAGE_PIPELINE_EAGER = False
+
+# Ограничения загружаемой картинки рецепта (api.fields) и запас
+# размера тела запроса на остальные поля рецепта (api.parsers).
+RECIPE_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_SIDE = 6000
+RECIPE_REQUEST_EXTRA_BYTES = 256 * 1024
+
+# Лента подписок (recipes.feed): 'read' - собирается при чтении,
+# 'write' - рецепты рассылаются по лентам подписчиков при публикации,
+# кроме авторов, у которых подписчиков больше порога.
+FEED_STRATEGY = os.getenv('FEED_STRATEGY', default='read')
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_TIMELINE_LENGTH = 500
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = 20
+INGREDIENT_INDEX_TTL = 300
+TAG_SLUG_MAP_TTL = 300
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 CORS_URLS_REGEX = r'^/admin/.*$'
@@ -1,5 +1,7 @@
 ﻿from django.contrib import admin
+from django.db.transaction import atomic
 
+from . import carts
 from .models import (Favorite, Ingredient, IngredientRecipe,
                      Recipe, ShoppingCart, Tag, TagRecipe)
 
@@ -44,6 +46,38 @@ class FavoriteAdmin(admin.ModelAdmin):
     list_filter = ('user',)
 
 
+class IngredientRecipeAdmin(admin.ModelAdmin):
+    """
+    Ингредиенты рецептов. Изменения переносятся в агрегаты
+    списков покупок (recipes.carts), как и при правке через API.
+    """
+    list_display = ('recipe', 'ingredient', 'amount')
+    search_fields = ('recipe__name', 'ingredient__name')
+    empty_value_display = '-пусто-'
+
+    @atomic
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.update(IngredientRecipe.objects.filter(
+                pk=obj.pk
+            ).values_list('recipe_id', flat=True))
+        with carts.track_recipes(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    @atomic
+    def delete_model(self, request, obj):
+        with carts.track_recipes([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    @atomic
+    def delete_queryset(self, request, queryset):
+        with carts.track_recipes(
+            queryset.values_list('recipe_id', flat=True)
+        ):
+            super().delete_queryset(request, queryset)
+
+
 class RecipeAdmin(admin.ModelAdmin):
     """
     Параметры админ панели (управление рецептами).
@@ -60,13 +94,13 @@ class RecipeAdmin(admin.ModelAdmin):
         Метод для подсчета общего числа
         добавлений этого рецепта в избранное.
         """
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
     in_favorite.short_description = 'Число добавлении в избранное'
 
 
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
-admin.site.register(IngredientRecipe)
+admin.site.register(IngredientRecipe, IngredientRecipeAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
 admin.site.register(Tag, TagAdmin)
@@ -0,0 +1,74 @@
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .caching import ProcessCache
+from .models import Ingredient
+
+
+class IngredientIndex(ProcessCache):
+    """
+    Отсортированный префиксный индекс ингредиентов в памяти процесса.
+    Строится из таблицы Ingredient при первом обращении и сбрасывается
+    сигналами при изменении ингредиентов.
+    """
+
+    def load(self):
+        """
+        Возвращает два отсортированных списка ключей: по началу названия
+        и по началу каждого следующего слова названия.
+        """
+        items = []
+        names = []
+        words = []
+        ingredients = Ingredient.objects.order_by('name', 'id').values_list(
+            'id', 'name', 'measurement_unit'
+        )
+        for position, (pk, name, unit) in enumerate(ingredients):
+            items.append(
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+            )
+            key = name.casefold()
+            names.append((key, position))
+            start = key.find(' ')
+            while start != -1:
+                words.append((key[start + 1:], position))
+                start = key.find(' ', start + 1)
+        names.sort()
+        words.sort()
+        return items, names, words
+
+    @staticmethod
+    def scan(keys, prefix, limit, seen):
+        found = []
+        index = bisect_left(keys, (prefix,))
+        while index < len(keys) and len(found) < limit:
+            key, position = keys[index]
+            if not key.startswith(prefix):
+                break
+            if position not in seen:
+                seen.add(position)
+                found.append(position)
+            index += 1
+        return found
+
+    def search(self, prefix, limit):
+        """
+        Ищет ингредиенты по началу названия без учета регистра.
+        Сначала идут точные совпадения и совпадения с началом названия,
+        затем - с началом любого другого слова в названии.
+        """
+        items, names, words = self.get()
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        seen = set()
+        found = self.scan(names, prefix, limit, seen)
+        if len(found) < limit:
+            found += self.scan(words, prefix, limit - len(found), seen)
+        return [items[position] for position in found]
+
+
+ingredient_index = IngredientIndex(
+    ttl=getattr(settings, 'INGREDIENT_INDEX_TTL', None)
+)
@@ -0,0 +1,121 @@
+from django.db import connections, router
+from django.db.transaction import atomic
+
+from . import carts
+from .models import Recipe, ShoppingCart
+
+
+def get_connection(model):
+    return connections[router.db_for_write(model)]
+
+
+def insert(model, user_id, recipe_ids):
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING: id рецептов,
+    строки которых действительно вставлены. Уже существующие
+    (в том числе добавленные параллельным запросом) пропускаются.
+    Запрос написан вручную и сигналов не шлет.
+    """
+    connection = get_connection(model)
+    quote = connection.ops.quote_name
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    objs = [model(user_id=user_id, recipe_id=pk) for pk in recipe_ids]
+    batch_size = connection.ops.bulk_batch_size(fields, objs)
+    placeholders = f'({", ".join(["%s"] * len(fields))})'
+    inserted = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {quote(model._meta.db_table)} '
+                f'({", ".join(quote(field.column) for field in fields)}) '
+                f'VALUES {", ".join([placeholders] * len(batch))} '
+                f'ON CONFLICT DO NOTHING '
+                f'RETURNING {quote(model._meta.get_field("recipe").column)}',
+                [
+                    field.get_db_prep_save(
+                        field.pre_save(obj, add=True), connection
+                    )
+                    for obj in batch for field in fields
+                ]
+            )
+            inserted.update(row[0] for row in cursor.fetchall())
+    return inserted
+
+
+def delete(model, user_id, recipe_ids):
+    """
+    DELETE ... RETURNING: id рецептов, строки которых действительно
+    удалены. Запрос написан вручную и сигналов не шлет.
+    """
+    connection = get_connection(model)
+    quote = connection.ops.quote_name
+    recipe_column = quote(model._meta.get_field('recipe').column)
+    recipe_ids = list(recipe_ids)
+    batch_size = connection.ops.bulk_batch_size(['recipe'], recipe_ids)
+    deleted = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), batch_size):
+            batch = recipe_ids[start:start + batch_size]
+            cursor.execute(
+                f'DELETE FROM {quote(model._meta.db_table)} '
+                f'WHERE {quote(model._meta.get_field("user").column)} = %s '
+                f'AND {recipe_column} IN ({", ".join(["%s"] * len(batch))}) '
+                f'RETURNING {recipe_column}',
+                [user_id, *batch]
+            )
+            deleted.update(row[0] for row in cursor.fetchall())
+    return deleted
+
+
+def write(model, user_id, add, remove):
+    """
+    Вставляет и удаляет связи пользователя с рецептами
+    (избранное или список покупок). Счетчики рецептов и агрегат
+    корзины обновляются здесь же и только по строкам, которые
+    запросы действительно вставили или удалили, поэтому
+    параллельное добавление того же рецепта не учитывается дважды.
+    Возвращает id добавленных и удаленных рецептов в порядке запроса.
+    """
+    add = list(dict.fromkeys(add))
+    remove = list(dict.fromkeys(remove))
+    inserted = insert(model, user_id, add) if add else set()
+    deleted = delete(model, user_id, remove) if remove else set()
+    added = [pk for pk in add if pk in inserted]
+    removed = [pk for pk in remove if pk in deleted]
+    if not added and not removed:
+        return added, removed
+    Recipe.objects.filter(pk__in=[*added, *removed]).rebuild_counters()
+    if model is ShoppingCart:
+        delta = carts.get_recipes_amounts(added)
+        for pk, amount in carts.get_recipes_amounts(removed).items():
+            delta[pk] = delta.get(pk, 0) - amount
+        carts.apply_delta([user_id], delta)
+    return added, removed
+
+
+@atomic
+def change(model, user_id, add=(), remove=()):
+    """
+    Добавляет рецепты add и убирает рецепты remove.
+    Возвращает id действительно добавленных и удаленных рецептов.
+    """
+    return write(model, user_id, add, remove)
+
+
+@atomic
+def sync(model, user_id, recipe_ids):
+    """
+    Приводит набор рецептов пользователя к recipe_ids.
+    """
+    current = set(model.objects.filter(user_id=user_id).values_list(
+        'recipe_id', flat=True
+    ))
+    return write(
+        model, user_id,
+        [pk for pk in recipe_ids if pk not in current],
+        sorted(current.difference(recipe_ids))
+    )
@@ -0,0 +1,36 @@
+import time
+from threading import Lock
+
+
+class ProcessCache:
+    """
+    Данные в памяти процесса, которые строит метод load() при первом
+    обращении. Сбрасываются invalidate() (сигналами при изменении
+    исходной таблицы), TTL ограничивает устаревание в других
+    процессах, где сигнал не срабатывал.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._data = None
+        self._built_at = 0.0
+
+    def load(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        self._data = None
+
+    def get(self):
+        data = self._data
+        if data is not None and (
+            self.ttl is None
+            or time.monotonic() - self._built_at < self.ttl
+        ):
+            return data
+        with self._lock:
+            if self._data is data:
+                self._data = self.load()
+                self._built_at = time.monotonic()
+            return self._data
@@ -0,0 +1,147 @@
+from contextlib import contextmanager
+
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import CartIngredient, IngredientRecipe, ShoppingCart
+
+
+def get_recipe_amounts(recipe_id):
+    """
+    Количества ингредиентов рецепта: {ingredient_id: amount}.
+    """
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id=recipe_id).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+def get_recipes_amounts(recipe_ids):
+    """
+    Суммарные количества ингредиентов нескольких рецептов
+    одним запросом: {ingredient_id: amount}.
+    """
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id__in=recipe_ids).values_list(
+            'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by()
+    )
+
+
+def apply_delta(user_ids, delta):
+    """
+    Прибавляет delta {ingredient_id: количество} к агрегатам
+    пользователей не более чем тремя запросами: вставка недостающих
+    строк, UPDATE с CASE по ингредиентам, удаление обнулившихся строк.
+    """
+    delta = {pk: amount for pk, amount in delta.items() if amount}
+    user_ids = list(user_ids)
+    if not delta or not user_ids:
+        return
+    added = [pk for pk, amount in delta.items() if amount > 0]
+    if added:
+        CartIngredient.objects.bulk_create([
+            CartIngredient(user_id=user_id, ingredient_id=pk)
+            for user_id in user_ids
+            for pk in added
+        ], ignore_conflicts=True)
+    rows = CartIngredient.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=delta
+    )
+    rows.update(total_amount=F('total_amount') + Case(
+        *(When(ingredient_id=pk, then=Value(amount))
+          for pk, amount in delta.items()),
+        default=Value(0),
+        output_field=IntegerField()
+    ))
+    if len(added) < len(delta):
+        rows.filter(total_amount__lte=0).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    apply_delta([user_id], get_recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    apply_delta([user_id], {
+        pk: -amount for pk, amount in get_recipe_amounts(recipe_id).items()
+    })
+
+
+def update_recipe(recipe_id, old_amounts, new_amounts):
+    """
+    Переносит изменение ингредиентов рецепта в агрегаты всех
+    пользователей, у которых рецепт лежит в корзине.
+    """
+    delta = {
+        pk: new_amounts.get(pk, 0) - old_amounts.get(pk, 0)
+        for pk in old_amounts.keys() | new_amounts.keys()
+    }
+    if not any(delta.values()):
+        return
+    apply_delta(
+        ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True
+        ),
+        delta
+    )
+
+
+@contextmanager
+def track_recipes(recipe_ids):
+    """
+    Переносит в агрегаты изменения ингредиентов рецептов, сделанные
+    внутри блока поштучно (например, в админке): количества
+    запоминаются до блока и сравниваются с тем, что стало после.
+    """
+    before = {pk: get_recipe_amounts(pk) for pk in set(recipe_ids)}
+    yield
+    for pk, old_amounts in before.items():
+        update_recipe(pk, old_amounts, get_recipe_amounts(pk))
+
+
+def get_live_totals(user_ids=None):
+    """
+    Агрегат, посчитанный заново по корзинам:
+    {(user_id, ingredient_id): total_amount}.
+    """
+    if user_ids is None:
+        rows = IngredientRecipe.objects.filter(recipe__cart__isnull=False)
+    else:
+        rows = IngredientRecipe.objects.filter(recipe__cart__user__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.values_list(
+            'recipe__cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+    }
+
+
+def get_stored_totals(user_ids=None):
+    rows = CartIngredient.objects.all()
+    if user_ids is not None:
+        rows = rows.filter(user__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.values_list(
+            'user_id', 'ingredient_id', 'total_amount'
+        )
+    }
+
+
+def rebuild(user_ids=None):
+    """
+    Пересобирает агрегаты (всех или указанных пользователей).
+    """
+    stored = CartIngredient.objects.all()
+    if user_ids is not None:
+        stored = stored.filter(user__in=user_ids)
+    stored.delete()
+    CartIngredient.objects.bulk_create([
+        CartIngredient(
+            user_id=user_id, ingredient_id=ingredient_id, total_amount=total
+        )
+        for (user_id, ingredient_id), total in get_live_totals(
+            user_ids
+        ).items()
+    ], batch_size=1000)
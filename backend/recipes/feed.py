@@ -0,0 +1,198 @@
+import heapq
+
+from django.conf import settings
+from django.db.models import Count, F, Q, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from users.models import Follow, User
+
+from .models import Recipe, TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+def get_strategy():
+    return getattr(settings, 'FEED_STRATEGY', 'read')
+
+
+def get_max_followers():
+    return getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 1000)
+
+
+def get_timeline_length():
+    return getattr(settings, 'FEED_TIMELINE_LENGTH', 500)
+
+
+def after(position, date_field, id_field):
+    """
+    Условие "после позиции" (pub_date, id) при сортировке
+    по убыванию.
+    """
+    if position is None:
+        return Q()
+    pub_date, pk = position
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(**{
+        date_field: pub_date, f'{id_field}__lt': pk
+    })
+
+
+def read_keys(user_id, position, limit, pending_only=False):
+    """
+    Fan-out-on-read: рецепты авторов из подписок, по индексу
+    (author, pub_date, id). С pending_only - только не разосланные
+    по лентам рецепты.
+    """
+    recipes = Recipe.objects.filter(
+        author__following__user_id=user_id
+    ).filter(after(position, 'pub_date', 'id'))
+    if pending_only:
+        recipes = recipes.filter(fanned_out=False)
+    return list(recipes.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id'
+    )[:limit])
+
+
+def timeline_keys(user_id, position, limit):
+    return list(TimelineEntry.objects.filter(user_id=user_id).filter(
+        after(position, 'pub_date', 'recipe_id')
+    ).order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id'
+    )[:limit])
+
+
+def get_page(user_id, position, limit):
+    """
+    Ключи (pub_date, id) следующих limit рецептов ленты, новые сверху.
+    В режиме 'write' лента пользователя сливается с рецептами,
+    которые по лентам не рассылались: от авторов с большим числом
+    подписчиков и опубликованные до включения режима.
+    """
+    if get_strategy() != 'write':
+        return read_keys(user_id, position, limit)
+    return heapq.nlargest(limit, [
+        *timeline_keys(user_id, position, limit),
+        *read_keys(user_id, position, limit, pending_only=True),
+    ])
+
+
+def trim(user_ids):
+    """
+    Оставляет в лентах пользователей последние
+    FEED_TIMELINE_LENGTH записей одним DELETE.
+    """
+    sql, params = TimelineEntry.objects.filter(
+        user_id__in=user_ids
+    ).annotate(position=Window(
+        expression=RowNumber(),
+        partition_by=[F('user_id')],
+        order_by=[F('pub_date').desc(), F('recipe_id').desc()]
+    )).order_by().values('id', 'position').query.sql_with_params()
+    TimelineEntry.objects.filter(pk__in=RawSQL(
+        f'SELECT ranked.id FROM ({sql}) ranked WHERE ranked.position > %s',
+        (*params, get_timeline_length())
+    )).delete()
+
+
+def fan_out(recipe):
+    """
+    Fan-out-on-write: добавляет новый рецепт в ленты подписчиков
+    автора. Если подписчиков больше FEED_FANOUT_MAX_FOLLOWERS,
+    рецепт остается неразосланным и попадает в ленты при чтении.
+    """
+    if get_strategy() != 'write':
+        return
+    limit = get_max_followers()
+    followers = list(Follow.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True)[:limit + 1])
+    if len(followers) > limit:
+        return
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe.pk,
+            author_id=recipe.author_id,
+            pub_date=recipe.pub_date
+        ) for user_id in followers
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+    Recipe.objects.filter(pk=recipe.pk).update(fanned_out=True)
+    recipe.fanned_out = True
+    if followers:
+        trim(followers)
+
+
+def follow(user_id, author_id):
+    """
+    Новая подписка: в ленту добавляются последние разосланные
+    рецепты автора.
+    """
+    if get_strategy() != 'write':
+        return
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            pub_date=pub_date
+        ) for recipe_id, pub_date in Recipe.objects.filter(
+            author_id=author_id, fanned_out=True
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'pub_date'
+        )[:get_timeline_length()]
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+    trim([user_id])
+
+
+def unfollow(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild():
+    """
+    Пересобирает ленты целиком под текущую стратегию и порог:
+    отмечает рецепты, которые рассылаются, и заполняет ленты
+    последними из них по каждой подписке.
+    """
+    TimelineEntry.objects.all().delete()
+    if get_strategy() != 'write':
+        Recipe.objects.filter(fanned_out=True).update(fanned_out=False)
+        return 0
+    popular = Follow.objects.values('author_id').annotate(
+        followers=Count('id')
+    ).filter(followers__gt=get_max_followers()).values('author_id')
+    Recipe.objects.exclude(author_id__in=popular).update(fanned_out=True)
+    Recipe.objects.filter(author_id__in=popular).update(fanned_out=False)
+    length = get_timeline_length()
+    user_ids = list(Follow.objects.values_list(
+        'user_id', flat=True
+    ).distinct().order_by('user_id'))
+    created = 0
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        follows = {}
+        for user_id, author_id in Follow.objects.filter(
+            user_id__in=user_ids[start:start + BATCH_SIZE]
+        ).values_list('user_id', 'author_id'):
+            follows.setdefault(user_id, []).append(author_id)
+        previews = Recipe.objects.filter(fanned_out=True).latest_by_authors(
+            User.objects.filter(following__user_id__in=follows).distinct(),
+            limit=length
+        )
+        entries = [
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe.pk,
+                author_id=recipe.author_id,
+                pub_date=recipe.pub_date
+            )
+            for user_id, author_ids in follows.items()
+            for recipe in heapq.nlargest(
+                length,
+                (recipe for author_id in author_ids
+                 for recipe in previews[author_id]),
+                key=lambda recipe: (recipe.pub_date, recipe.pk)
+            )
+        ]
+        TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+        created += len(entries)
+    return created
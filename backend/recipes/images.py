@@ -0,0 +1,200 @@
+import hashlib
+import io
+import logging
+import queue
+from threading import Lock, Thread
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/images/variants'
+# Вариант -> наибольшая сторона в пикселях.
+VARIANTS = {
+    'thumbnail': 320,
+    'medium': 960,
+}
+# Формат -> (расширение, параметры сохранения Pillow).
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 85, 'optimize': True,
+                     'progressive': True}),
+}
+HASH_LENGTH = 16
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def to_rgb(image):
+    """
+    JPEG не хранит прозрачность: прозрачные области
+    заливаются белым.
+    """
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(file):
+    """
+    Строит уменьшенные копии изображения во всех форматах.
+    Имена файлов содержат хэш исходника, поэтому их можно
+    кэшировать сколь угодно долго.
+    Возвращает {вариант: {формат: путь в хранилище}}.
+    """
+    digest = content_hash(file)
+    with Image.open(file) as original:
+        original = to_rgb(ImageOps.exif_transpose(original))
+    variants = {}
+    for variant, size in VARIANTS.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[variant] = {}
+        for image_format, (extension, options) in FORMATS.items():
+            name = f'{VARIANTS_DIR}/{digest}-{variant}.{extension}'
+            if not default_storage.exists(name):
+                buffer = io.BytesIO()
+                image.save(buffer, **options)
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue())
+                )
+            variants[variant][image_format] = name
+    return variants
+
+
+def variant_names(variants):
+    return {
+        name for formats in variants.values() for name in formats.values()
+    }
+
+
+def delete_variants(variants):
+    """
+    Удаляет из хранилища файлы вариантов, на которые больше
+    не ссылается ни один рецепт: у одинаковых картинок разных
+    рецептов файлы общие, имена строятся по хэшу содержимого.
+    """
+    references = Q()
+    for variant, formats in variants.items():
+        for image_format, name in formats.items():
+            references |= Q(**{
+                f'image_variants__{variant}__{image_format}': name
+            })
+    if not references:
+        return
+    used = set()
+    for recipe_variants in Recipe.objects.filter(references).values_list(
+        'image_variants', flat=True
+    ):
+        used |= variant_names(recipe_variants)
+    for name in variant_names(variants) - used:
+        default_storage.delete(name)
+
+
+def discard_variants(variants):
+    """
+    Удаляет файлы вариантов замененной или удаленной картинки
+    после фиксации транзакции.
+    """
+    if variants:
+        transaction.on_commit(lambda: delete_variants(variants))
+
+
+def build_variants(recipe_id):
+    """
+    Строит варианты картинки рецепта и сохраняет их пути.
+    Если картинку успели заменить, результат отбрасывается
+    и его файлы удаляются: новую картинку обработает ее
+    собственная задача.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return None
+    name = recipe.image.name
+    with recipe.image.open('rb') as file:
+        variants = render_variants(file)
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_id
+        ).first()
+        if recipe is None or recipe.image.name != name:
+            discard_variants(variants)
+            return None
+        recipe.image_variants = variants
+        recipe.save(update_fields=('image_variants', 'updated_at'))
+    return variants
+
+
+class LocalImageQueue:
+    """
+    Локальная замена очереди задач: задачи выполняются по одной
+    в фоновом потоке процесса. Интерфейс (enqueue) тот же, что был бы
+    у задачи внешней очереди. С IMAGE_PIPELINE_EAGER = True задачи
+    выполняются сразу в вызывающем потоке.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = Lock()
+        self._thread = None
+
+    def enqueue(self, recipe_id):
+        if getattr(settings, 'IMAGE_PIPELINE_EAGER', False):
+            build_variants(recipe_id)
+            return
+        self.start()
+        self._queue.put(recipe_id)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(
+                    target=self.run, name='image-pipeline', daemon=True
+                )
+                self._thread.start()
+
+    def run(self):
+        while True:
+            recipe_id = self._queue.get()
+            close_old_connections()
+            try:
+                build_variants(recipe_id)
+            except Exception:
+                logger.exception(
+                    'Не удалось обработать картинку рецепта %s', recipe_id
+                )
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+    def join(self):
+        self._queue.join()
+
+
+image_queue = LocalImageQueue()
+
+
+def schedule_variants(recipe):
+    """
+    Ставит рецепт в очередь после фиксации транзакции,
+    чтобы фоновый поток увидел сохраненную картинку.
+    """
+    transaction.on_commit(lambda: image_queue.enqueue(recipe.pk))
@@ -0,0 +1,21 @@
+from django.conf import settings
+
+from .caching import ProcessCache
+from .models import Tag
+
+
+class TagSlugMap(ProcessCache):
+    """
+    Соответствие slug -> id тегов в памяти процесса.
+    Позволяет фильтровать рецепты по тегам без запроса к таблице Tag.
+    """
+
+    def load(self):
+        return dict(Tag.objects.values_list('slug', 'id'))
+
+
+tag_slug_map = TagSlugMap(ttl=getattr(settings, 'TAG_SLUG_MAP_TTL', None))
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in tag_slug_map.get()]
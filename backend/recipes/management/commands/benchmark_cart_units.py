@@ -0,0 +1,71 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.units import UNITS, fold_units
+
+EXTRA_UNITS = ('шт.', 'по вкусу', 'щепотка')
+
+
+class Command(BaseCommand):
+    """
+    Команда 'benchmark_cart_units' измеряет сведение единиц
+    списка покупок на синтетических корзинах разного размера.
+    Время на строку должно оставаться примерно постоянным.
+    python manage.py benchmark_cart_units --sizes 1000 4000 16000
+    """
+    help = 'Бенчмарк сведения единиц измерения списка покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 2000, 4000, 8000, 16000],
+            help='Число строк корзины'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Число повторов на размер'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def make_cart(self, size, rnd):
+        """
+        Строки как из агрегата корзины: по 1-3 единицы на название,
+        отсортированы по названию и единице.
+        """
+        units = list(UNITS) + list(EXTRA_UNITS)
+        cart = []
+        number = 0
+        while len(cart) < size:
+            for unit in sorted(rnd.sample(units, rnd.randint(1, 3))):
+                cart.append({
+                    'name': f'ингредиент {number:06d}',
+                    'measurement_unit': unit,
+                    'total_amount': rnd.randint(1, 1000),
+                })
+            number += 1
+        return cart[:size]
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        self.stdout.write(
+            f"{'rows':>8} {'lines':>8} {'p50 ms':>10} {'us/row':>8}"
+        )
+        for size in options['sizes']:
+            cart = self.make_cart(size, rnd)
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                lines = fold_units(cart)
+                timings.append(time.perf_counter() - started)
+            median = statistics.median(timings)
+            self.stdout.write(
+                f'{size:>8} {len(lines):>8} {median * 1000:>10.3f} '
+                f'{median / size * 1e6:>8.3f}'
+            )
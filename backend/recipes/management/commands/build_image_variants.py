@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Команда 'build_image_variants' строит уменьшенные копии картинок
+    рецептов, для которых их еще нет (например, загруженных до
+    появления фоновой обработки). С --all перестраивает все.
+    python manage.py build_image_variants
+    """
+    help = 'Построение уменьшенных копий картинок рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить копии всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        built = failed = 0
+        started = time.perf_counter()
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            try:
+                build_variants(recipe_id)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано: {built}, ошибок: {failed}, '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import carts
+
+
+class Command(BaseCommand):
+    """
+    Команда 'check_cart_totals' сверяет агрегат списков покупок
+    (CartIngredient) с суммой, посчитанной заново по корзинам.
+    С флагом --fix пересобирает агрегат расходящихся пользователей.
+    python manage.py check_cart_totals
+    python manage.py check_cart_totals --fix
+    """
+    help = 'Проверка агрегата списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Пересобрать агрегат пользователей с расхождениями'
+        )
+
+    def handle(self, *args, **options):
+        live = carts.get_live_totals()
+        stored = carts.get_stored_totals()
+        mismatches = sorted(
+            key for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        )
+        for user_id, ingredient_id in mismatches:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'ожидается {live.get((user_id, ingredient_id), 0)}, '
+                f'в агрегате {stored.get((user_id, ingredient_id), 0)}'
+            )
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS(
+                f'Расхождений нет, строк: {len(live)}'
+            ))
+            return
+        user_ids = sorted({user_id for user_id, _ in mismatches})
+        if options['fix']:
+            carts.rebuild(user_ids)
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересобран агрегат пользователей: {len(user_ids)}'
+            ))
+        else:
+            raise CommandError(
+                f'Расхождений: {len(mismatches)}, '
+                f'пользователей: {len(user_ids)}'
+            )
@@ -0,0 +1,185 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic
+
+from recipes import carts
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.signals import bulk_loaded
+from users.models import Follow, User
+
+IMAGE = 'recipes/images/synthetic.png'
+PASSWORD = 'synthetic-password'
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = (
+    'суп', 'салат', 'пирог', 'рагу', 'каша', 'омлет', 'паста', 'плов',
+    'запеканка', 'котлеты', 'блины', 'соус', 'десерт', 'гарнир',
+)
+
+
+class Command(BaseCommand):
+    """
+    Команда 'generate_dataset' заполняет базу синтетическими данными
+    для бенчмарков: пользователи, рецепты с 5-20 ингредиентами, теги,
+    избранное, списки покупок и подписки. Каждая таблица пишется
+    через bulk_create, денормализованные счетчики и агрегаты корзин
+    затем пересчитываются целиком, а кэши сбрасываются
+    сигналом bulk_loaded.
+    Пользователи создаются с префиксом --prefix и паролем
+    synthetic-password; --clear удаляет ранее созданные данные.
+    python manage.py generate_dataset --users 1000 --recipes 10000
+    """
+    help = 'Генерация синтетических данных для бенчмарков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--tags',
+            type=int,
+            default=5,
+            help='Минимальное число тегов в базе'
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=500,
+            help='Сколько ингредиентов создать, если таблица пуста'
+        )
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--prefix', type=str, default='synthetic')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить пользователей с префиксом и их данные'
+        )
+
+    def step(self, title, started):
+        self.stdout.write(
+            f'{title}: {(time.perf_counter() - started) * 1000:.0f} ms'
+        )
+        return time.perf_counter()
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        users = User.objects.filter(username__startswith=f'{prefix}-')
+        if options['clear']:
+            deleted, _ = users.delete()
+            self.stdout.write(f'Удалено объектов: {deleted}')
+        elif users.exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                f'используйте --clear или другой --prefix.'
+            )
+        with atomic():
+            self.generate(options, random.Random(options['seed']))
+
+    def generate(self, options, rnd):
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(
+                username=f'{prefix}-{number}',
+                email=f'{prefix}-{number}@example.com',
+                first_name=f'Имя {number}',
+                last_name=f'Фамилия {number}',
+                password=password,
+            ) for number in range(options['users'])
+        ], batch_size=batch_size)
+        user_ids = list(User.objects.filter(
+            username__startswith=f'{prefix}-'
+        ).values_list('id', flat=True))
+        started = self.step('Пользователи', started)
+
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {number}', slug=f'{prefix}-tag-{number}',
+                color=f'#{rnd.randrange(0x1000000):06X}')
+            for number in range(options['tags'] - Tag.objects.count())
+        ], ignore_conflicts=True)
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create([
+                Ingredient(name=f'ингредиент {number}',
+                           measurement_unit=rnd.choice(UNITS))
+                for number in range(options['ingredients'])
+            ], batch_size=batch_size)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        started = self.step('Теги и ингредиенты', started)
+
+        Recipe.objects.bulk_create([
+            Recipe(
+                author_id=rnd.choice(user_ids),
+                name=f'{rnd.choice(WORDS).capitalize()} {number}',
+                text=' '.join(rnd.choices(WORDS, k=30)),
+                cooking_time=rnd.randint(5, 180),
+                image=IMAGE,
+            ) for number in range(options['recipes'])
+        ], batch_size=batch_size)
+        recipe_ids = list(Recipe.objects.filter(
+            author__username__startswith=f'{prefix}-'
+        ).values_list('id', flat=True))
+        started = self.step('Рецепты', started)
+
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rnd.sample(
+                ingredient_ids, min(len(ingredient_ids), rnd.randint(5, 20))
+            )
+        ], batch_size=batch_size)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rnd.sample(
+                tag_ids, min(len(tag_ids), rnd.randint(1, 3))
+            )
+        ], batch_size=batch_size)
+        started = self.step('Ингредиенты и теги рецептов', started)
+
+        for model, per_user in ((Favorite, options['favorites']),
+                                (ShoppingCart, options['carts'])):
+            model.objects.bulk_create([
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in rnd.sample(
+                    recipe_ids, min(len(recipe_ids), per_user)
+                )
+            ], batch_size=batch_size)
+        Follow.objects.bulk_create([
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in [
+                author_id for author_id in rnd.sample(
+                    user_ids, min(len(user_ids), options['follows'] + 1)
+                ) if author_id != user_id
+            ][:options['follows']]
+        ], batch_size=batch_size)
+        started = self.step('Избранное, корзины, подписки', started)
+
+        Recipe.objects.filter(
+            author__username__startswith=f'{prefix}-'
+        ).rebuild_counters()
+        carts.rebuild(user_ids)
+        for model in (User, Tag, Ingredient, Recipe, IngredientRecipe,
+                      Favorite, ShoppingCart, Follow):
+            bulk_loaded.send(sender=model)
+        self.step('Счетчики и агрегаты корзин', started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(user_ids)}, рецептов: {len(recipe_ids)}'
+        ))
@@ -0,0 +1,123 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient, Tag
+from recipes.signals import bulk_loaded
+
+DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+JSON_CHUNK_SIZE = 64 * 1024
+
+MODELS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit')),
+    'tags': (Tag, ('name', 'color', 'slug')),
+}
+
+
+def read_csv(path, fields):
+    with open(path, 'r', encoding='utf-8') as file:
+        for row in csv.reader(file):
+            if row:
+                yield dict(zip(fields, row))
+
+
+def read_json(path, fields):
+    """
+    Читает JSON-массив объектов по одному элементу,
+    не загружая файл в память целиком.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError(f'{path}: ожидается JSON-массив')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(JSON_CHUNK_SIZE)
+                if not chunk:
+                    raise CommandError(f'{path}: неожиданный конец файла')
+                buffer += chunk
+                continue
+            yield {field: item[field] for field in fields}
+            buffer = buffer[end:]
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+class Command(BaseCommand):
+    """
+    Команда 'load_data' загружает ингредиенты или теги
+    из csv или json файла пачками через bulk_create.
+    Повторный запуск безопасен: уже существующие записи
+    пропускаются по уникальным ограничениям модели.
+    bulk_create не вызывает post_save, поэтому кэши справочника
+    сбрасываются в конце сигналом bulk_loaded.
+    python manage.py load_data ingredients
+    python manage.py load_data ingredients --path ingredients.json
+    python manage.py load_data tags --path tags.csv
+    """
+    help = 'Загрузка ингредиентов и тегов из csv/json файлов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'model',
+            choices=sorted(MODELS),
+            help='Какие данные загружать'
+        )
+        parser.add_argument(
+            '--path',
+            type=str,
+            help=('Файл с данными, по умолчанию <model>.csv; '
+                  'относительные пути ищутся в директории data/')
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для bulk_create'
+        )
+
+    def handle(self, *args, **options):
+        model, fields = MODELS[options['model']]
+        path = os.path.join(
+            DATA_ROOT, options['path'] or f"{options['model']}.csv"
+        )
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        batch_size = options['batch_size']
+        rows = (model(**row) for row in reader(path, fields))
+        count_before = model.objects.count()
+        processed = 0
+        started = time.perf_counter()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            processed += len(batch)
+        elapsed = time.perf_counter() - started
+        created = model.objects.count() - count_before
+        if created:
+            bulk_loaded.send(sender=model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено: {created}, '
+            f'{processed / elapsed if elapsed else 0:.0f} строк/с'
+        ))
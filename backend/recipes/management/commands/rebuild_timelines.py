@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    """
+    Команда 'rebuild_timelines' пересобирает ленты подписок под
+    текущие FEED_STRATEGY и FEED_FANOUT_MAX_FOLLOWERS. Нужна при
+    смене стратегии или порога и после массовой загрузки рецептов
+    и подписок в обход сигналов (например, generate_dataset).
+    python manage.py rebuild_timelines
+    """
+    help = 'Пересборка лент подписок.'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with atomic():
+            created = feed.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Стратегия: {feed.get_strategy()}, записей в лентах: '
+            f'{created} за {elapsed:.2f} с'
+        ))
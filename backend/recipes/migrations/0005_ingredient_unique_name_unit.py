@@ -0,0 +1,42 @@
+# Generated by Django 3.2.14 on 2026-10-18 01:49
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Оставляет один ингредиент на пару (name, measurement_unit),
+    ссылки из рецептов переводятся на оставшийся.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        extra = Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keep_id'])
+        IngredientRecipe.objects.filter(ingredient__in=extra).update(
+            ingredient_id=group['keep_id']
+        )
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_auto_20230118_1223'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_unit'),
+        ),
+    ]
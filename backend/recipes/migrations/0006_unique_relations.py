@@ -0,0 +1,66 @@
+# Generated by Django 3.2.14 on 2026-10-18 01:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+RELATIONS = (
+    ('Favorite', ('user', 'recipe')),
+    ('ShoppingCart', ('user', 'recipe')),
+    ('TagRecipe', ('tag', 'recipe')),
+)
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Удаляет повторяющиеся связи перед созданием ограничений.
+    Для ингредиентов рецепта количество суммируется в оставшейся строке.
+    """
+    for model_name, fields in RELATIONS:
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values(*fields).annotate(
+            keep_id=Min('id'), total=Count('id')
+        ).filter(total__gt=1)
+        for group in duplicates:
+            model.objects.filter(
+                **{field: group[field] for field in fields}
+            ).exclude(id=group['keep_id']).delete()
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = IngredientRecipe.objects.values(
+        'ingredient', 'recipe'
+    ).annotate(
+        keep_id=Min('id'), total=Count('id'), amount_sum=Sum('amount')
+    ).filter(total__gt=1)
+    for group in duplicates:
+        IngredientRecipe.objects.filter(
+            ingredient=group['ingredient'], recipe=group['recipe']
+        ).exclude(id=group['keep_id']).delete()
+        IngredientRecipe.objects.filter(id=group['keep_id']).update(
+            amount=group['amount_sum']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('recipe', 'user'), name='unique_favorites'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'recipe'), name='unique_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_cart'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagrecipe',
+            constraint=models.UniqueConstraint(fields=('tag', 'recipe'), name='unique_tagrecipe'),
+        ),
+    ]
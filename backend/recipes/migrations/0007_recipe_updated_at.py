@@ -0,0 +1,27 @@
+# Generated by Django 3.2.14 on 2026-10-18 02:10
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def set_updated_at(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(updated_at=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_unique_relations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.14 on 2026-10-18 02:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Составной индекс (tag_id, recipe_id) для автоматической
+    таблицы связи Recipe.tags: фильтр по тегам через EXISTS
+    читает только индекс.
+    """
+
+    dependencies = [
+        ('recipes', '0008_recipe_pub_date_id_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX recipes_recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id);',
+            'DROP INDEX recipes_recipe_tags_tag_recipe_idx;'
+        ),
+    ]
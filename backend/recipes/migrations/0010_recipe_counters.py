@@ -0,0 +1,46 @@
+# Generated by Django 3.2.14 on 2026-10-18 01:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe'
+        ).annotate(total=Count('id')).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(
+        favorites_count=count_subquery(apps.get_model('recipes', 'Favorite')),
+        carts_count=count_subquery(apps.get_model('recipes', 'ShoppingCart'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в избранное'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.14 on 2026-10-18 02:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_cart_totals(apps, schema_editor):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    CartIngredient = apps.get_model('recipes', 'CartIngredient')
+    totals = IngredientRecipe.objects.filter(
+        recipe__cart__user__isnull=False
+    ).values_list('recipe__cart__user', 'ingredient').annotate(
+        total=Sum('amount')
+    ).order_by()
+    CartIngredient.objects.bulk_create([
+        CartIngredient(
+            user_id=user_id, ingredient_id=ingredient_id, total_amount=total
+        )
+        for user_id, ingredient_id, total in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(default=0, verbose_name='Общее количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент списка покупок',
+                'verbose_name_plural': 'Ингредиенты списка покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_ingredient'),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
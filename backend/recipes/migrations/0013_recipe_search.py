@@ -0,0 +1,106 @@
+from django.db import migrations
+
+# SQL зафиксирован здесь, а не импортируется из recipes.search:
+# миграция должна работать так же и после изменений модуля.
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+POSTGRES_INSTALL = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    f"""
+    CREATE FUNCTION recipes_recipe_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('{SEARCH_CONFIG}',
+                                     coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector()
+    """,
+    'UPDATE recipes_recipe SET name = name',
+    'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+    'USING GIN (search_vector)',
+)
+POSTGRES_UNINSTALL = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_update '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector()',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+SQLITE_INSTALL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    f"name, text, content='recipes_recipe', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+SQLITE_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+STATEMENTS = {
+    'postgresql': (POSTGRES_INSTALL, POSTGRES_UNINSTALL),
+    'sqlite': (SQLITE_INSTALL, SQLITE_UNINSTALL),
+}
+
+
+def run(schema_editor, index):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements[index]:
+            cursor.execute(sql)
+
+
+def install_search(apps, schema_editor):
+    run(schema_editor, 0)
+
+
+def uninstall_search(apps, schema_editor):
+    run(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
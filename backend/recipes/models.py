@@ -2,7 +2,12 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Prefetch, Subquery, UniqueConstraint, Value,
+                              Window)
+from django.db.models.functions import Coalesce, RowNumber
+
+from users.models import Follow
 
 User = get_user_model()
 
@@ -28,6 +33,10 @@ class Tag(models.Model):
         verbose_name='Цвет',
         max_length=7,
         help_text='Введите цвет тега')
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -55,16 +64,120 @@ class Ingredient(models.Model):
         help_text='Введите единицы измерения',
         null=False
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = [
+            UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
 
+def count_subquery(model):
+    """
+    Число строк model, ссылающихся на рецепт, как подзапрос.
+    """
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe'
+        ).annotate(total=Count('id')).values('total')
+    ), 0)
+
+
+class RecipeQuerySet(models.QuerySet):
+    """
+    Выборка рецептов со всеми связанными данными для сериализации.
+    """
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует флаги is_favorited и is_in_shopping_cart
+        подзапросами Exists вместо отдельного запроса на каждый рецепт.
+        """
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
+
+    def with_related(self, user):
+        """
+        Загружает автора, теги и ингредиенты фиксированным числом
+        запросов независимо от размера страницы.
+        """
+        queryset = self.prefetch_related(
+            'tags',
+            Prefetch(
+                'ingridients_recipe',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            )
+        ).with_user_flags(user)
+        if user.is_anonymous:
+            return queryset.select_related('author')
+        return queryset.prefetch_related(Prefetch(
+            'author',
+            queryset=User.objects.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        ))
+
+    def latest_by_authors(self, authors, limit=None):
+        """
+        Последние рецепты каждого из авторов одним запросом.
+        При заданном limit рецепты нумеруются ROW_NUMBER() в разрезе
+        автора и отбираются первые limit для каждого.
+        Возвращает словарь {id автора: [рецепты]}.
+        """
+        queryset = self.filter(author__in=authors)
+        if limit is None:
+            recipes = queryset.order_by('author_id', '-pub_date', '-id')
+        else:
+            sql, params = queryset.annotate(author_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()]
+            )).order_by().query.sql_with_params()
+            recipes = self.raw(
+                f'SELECT * FROM ({sql}) ranked '
+                f'WHERE ranked.author_rank <= %s '
+                f'ORDER BY ranked.author_id, ranked.author_rank',
+                (*params, limit)
+            )
+        previews = {author.pk: [] for author in authors}
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        return previews
+
+    def rebuild_counters(self):
+        """
+        Пересчитывает favorites_count и carts_count
+        одним UPDATE с подзапросами.
+        """
+        return self.update(
+            favorites_count=count_subquery(Favorite),
+            carts_count=count_subquery(ShoppingCart)
+        )
+
+
 class Recipe(models.Model):
     """
     Модель рецептов.
@@ -93,6 +206,10 @@ class Recipe(models.Model):
         help_text='Добавить дату создания',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
         help_text='Введите описания рецепта',
@@ -111,17 +228,54 @@ class Recipe(models.Model):
         help_text='Выберите изображение рецепта',
         default=None
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     cooking_time = models.IntegerField(
         default=1,
         validators=[MinValueValidator(1, 'Значение не может быть меньше 1')],
         verbose_name='Время готовки в минутах',
         help_text='Введите время приготовления'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в избранное'
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число добавлений в список покупок'
+    )
+    fanned_out = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Разослан по лентам подписчиков'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            )
+        ]
 
     def __str__(self):
         return f'Автор: {self.author.username} рецепт: {self.name}'
@@ -149,9 +303,12 @@ class Favorite(models.Model):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
         default_related_name = 'favorites'
-        UniqueConstraint(
-            fields=['recipe', 'user'],
-            name='unique_favorites')
+        constraints = [
+            UniqueConstraint(
+                fields=['recipe', 'user'],
+                name='unique_favorites'
+            )
+        ]
 
     def __str__(self):
         return f"{self.user} избран {self.recipe.name}"
@@ -183,15 +340,105 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Покупка'
         verbose_name_plural = 'Покупки'
-        UniqueConstraint(
-            fields=['user', 'recipe'],
-            name='unique_cart')
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_cart'
+            )
+        ]
 
     def __str__(self):
         return (f'Пользователь: {self.user.username},'
                 f'рецепт в списке: {self.recipe.name}')
 
 
+class CartIngredient(models.Model):
+    """
+    Агрегат списка покупок: сколько ингредиента нужно пользователю
+    по всем рецептам из его корзины. Обновляется инкрементально
+    при изменении корзины и ингредиентов рецептов (recipes.carts).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='cart_ingredients',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='cart_totals',
+    )
+    total_amount = models.IntegerField(
+        default=0,
+        verbose_name='Общее количество'
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.ingredient_id} - {self.total_amount}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Запись ленты подписок пользователя (fan-out-on-write):
+    рецепт автора, на которого он подписан. Лента ограничена
+    последними FEED_TIMELINE_LENGTH записями (recipes.feed).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='timeline',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор рецепта',
+        related_name='+',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
 class IngredientRecipe(models.Model):
     """
     Кастомная модель свяизи ингридиентов и рецептов.
@@ -219,9 +466,12 @@ class IngredientRecipe(models.Model):
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецепте'
         default_related_name = 'ingridients_recipe'
-        UniqueConstraint(
-            fields=['ingredient', 'recipe'],
-            name='unique_ingredient')
+        constraints = [
+            UniqueConstraint(
+                fields=['ingredient', 'recipe'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return (f'В рецепте {self.recipe.name} {self.amount} '
@@ -248,9 +498,12 @@ class TagRecipe(models.Model):
     class Meta:
         verbose_name = 'Теги рецепта'
         verbose_name_plural = 'Теги рецепта'
-        UniqueConstraint(
-            fields=['tag', 'recipe'],
-            name='unique_tagrecipe')
+        constraints = [
+            UniqueConstraint(
+                fields=['tag', 'recipe'],
+                name='unique_tagrecipe'
+            )
+        ]
 
     def __str__(self):
         return f'{self.tag} {self.recipe}'
@@ -0,0 +1,131 @@
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+MAX_TERMS = 8
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+    CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f'{FTS_TABLE}_delete': f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f'{FTS_TABLE}_update': f"""
+    CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF name, text
+    ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+}
+
+
+def install_sqlite_triggers(cursor):
+    """
+    Создает недостающие триггеры синхронизации FTS5-индекса.
+    Возвращает True, если чего-то не хватало: тогда индекс
+    мог отстать от таблицы и его нужно перестроить.
+    """
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+        "AND tbl_name = 'recipes_recipe'"
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    missing = [
+        sql for name, sql in SQLITE_TRIGGERS.items() if name not in existing
+    ]
+    for sql in missing:
+        cursor.execute(sql)
+    return bool(missing)
+
+
+def repair_sqlite(connection):
+    """
+    SQLite при изменении схемы пересоздает таблицу recipes_recipe
+    и теряет ее триггеры, поэтому после migrate они
+    восстанавливаются, если индекс установлен.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            (FTS_TABLE,)
+        )
+        if cursor.fetchone() is None:
+            return
+        if install_sqlite_triggers(cursor):
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+
+
+def get_terms(query):
+    """
+    Слова запроса. Из них запрос к индексу собирается заново,
+    поэтому спецсимволы синтаксиса поиска до БД не доходят.
+    """
+    return re.findall(r'\w+', query.casefold())[:MAX_TERMS]
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты, в названии или описании которых есть все слова запроса
+    (по началу слова), с аннотацией search_rank: чем больше, тем
+    релевантнее, совпадения в названии весят больше. Запрос без слов
+    (одни знаки препинания) ничего не находит, но аннотация есть
+    и у пустого результата: по ней сортируют фильтр и курсор.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        ).none()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        match = (
+            f"recipes_recipe.search_vector @@ "
+            f"to_tsquery('{SEARCH_CONFIG}', %s)"
+        )
+        rank = RawSQL(
+            f"ts_rank(recipes_recipe.search_vector, "
+            f"to_tsquery('{SEARCH_CONFIG}', %s))",
+            (tsquery,), output_field=FloatField()
+        )
+        return queryset.annotate(search_rank=rank).filter(
+            pk__in=RawSQL(
+                f'SELECT id FROM recipes_recipe WHERE {match}', (tsquery,)
+            )
+        )
+    if connection.vendor == 'sqlite':
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND {FTS_TABLE}.rowid = recipes_recipe.id',
+            (fts_query,), output_field=FloatField()
+        )
+        return queryset.annotate(search_rank=rank).filter(
+            pk__in=RawSQL(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                (fts_query,)
+            )
+        )
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(text__icontains=term)
+    return queryset.annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    ).filter(condition)
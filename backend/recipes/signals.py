@@ -0,0 +1,111 @@
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete)
+from django.dispatch import Signal, receiver
+
+from users.models import Follow
+
+from . import carts, feed, search
+from .autocomplete import ingredient_index
+from .images import discard_variants
+from .lookups import tag_slug_map
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'carts_count',
+}
+
+# Массовая загрузка строк модели sender в обход save() и сигналов
+# post_save (bulk_create в командах load_data и generate_dataset).
+bulk_loaded = Signal()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(bulk_loaded, sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """
+    Сбрасывает индекс автодополнения при изменении ингредиентов.
+    Сброс откладывается до коммита, иначе индекс может быть
+    перестроен по данным незавершенной транзакции.
+    """
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(bulk_loaded, sender=Tag)
+def invalidate_tag_slug_map(**kwargs):
+    """
+    Сбрасывает кэш соответствия slug -> id тегов после коммита.
+    """
+    transaction.on_commit(tag_slug_map.invalidate)
+
+
+def update_counter(sender, instance, delta):
+    field = COUNTERS[sender]
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        **{field: F(field) + delta}
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    """
+    Увеличивает счетчик рецепта в той же транзакции, что и вставка.
+    """
+    if created:
+        update_counter(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    update_counter(sender, instance, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_cart_totals(instance, created, **kwargs):
+    if created:
+        carts.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_cart_totals(instance, **kwargs):
+    """
+    Вычитается до удаления: при удалении рецепта каскадом
+    его ингредиенты к post_delete могут быть уже удалены.
+    """
+    carts.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_image_variants(instance, **kwargs):
+    discard_variants(instance.image_variants)
+
+
+@receiver(post_save, sender=Follow)
+def fill_timeline(instance, created, **kwargs):
+    if created:
+        feed.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_timeline(instance, **kwargs):
+    feed.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_migrate)
+def repair_search_index(using, **kwargs):
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        search.repair_sqlite(connection)
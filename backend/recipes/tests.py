@@ -0,0 +1,297 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from users.models import User
+
+from . import carts, images
+from .autocomplete import ingredient_index
+from .caching import ProcessCache
+from .lookups import tag_slug_map
+from .models import Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
+from .units import fold_units, normalize_unit
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class CountingCache(ProcessCache):
+
+    def __init__(self, ttl=None):
+        super().__init__(ttl)
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.loads
+
+
+class ProcessCacheTest(SimpleTestCase):
+
+    def test_loads_once_until_invalidated(self):
+        cache = CountingCache()
+        self.assertEqual([cache.get(), cache.get()], [1, 1])
+        cache.invalidate()
+        self.assertEqual(cache.get(), 2)
+
+    def test_ttl(self):
+        cache = CountingCache(ttl=10)
+        with mock.patch('recipes.caching.time.monotonic', return_value=100):
+            self.assertEqual(cache.get(), 1)
+        with mock.patch('recipes.caching.time.monotonic', return_value=105):
+            self.assertEqual(cache.get(), 1)
+        with mock.patch('recipes.caching.time.monotonic', return_value=111):
+            self.assertEqual(cache.get(), 2)
+
+
+class LookupSignalsTest(TestCase):
+    """
+    Кэши тегов и ингредиентов сбрасываются при изменении таблиц.
+    """
+
+    def test_tag_slug_map(self):
+        tag_slug_map.invalidate()
+        self.assertEqual(tag_slug_map.get(), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name='Завтрак', slug='breakfast',
+                                     color='#FF0000')
+            self.assertEqual(tag_slug_map.get(), {})
+        self.assertEqual(tag_slug_map.get(), {'breakfast': tag.pk})
+
+    def test_ingredient_index(self):
+        ingredient_index.invalidate()
+        self.assertEqual(ingredient_index.search('сол', 10), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            salt = Ingredient.objects.create(name='соль морская',
+                                             measurement_unit='г')
+            Ingredient.objects.create(name='морская капуста',
+                                      measurement_unit='г')
+            self.assertEqual(ingredient_index.search('сол', 10), [])
+        self.assertEqual(
+            [item['id'] for item in ingredient_index.search('сол', 10)],
+            [salt.pk]
+        )
+        self.assertEqual(
+            [item['name'] for item in ingredient_index.search('мор', 10)],
+            ['морская капуста', 'соль морская']
+        )
+
+    def load_data(self, model, rows):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, f'{model}.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(rows)
+        call_command('load_data', model, '--path', path, stdout=io.StringIO())
+
+    def test_load_data(self):
+        ingredient_index.invalidate()
+        tag_slug_map.invalidate()
+        self.assertEqual(ingredient_index.search('сол', 10), [])
+        self.assertEqual(tag_slug_map.get(), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.load_data('ingredients', 'соль,г\nсахар,г\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.load_data('tags', 'Завтрак,#FF0000,breakfast\n')
+        self.assertEqual(
+            [item['name'] for item in ingredient_index.search('сол', 10)],
+            ['соль']
+        )
+        self.assertEqual(
+            tag_slug_map.get(),
+            {'breakfast': Tag.objects.get(slug='breakfast').pk}
+        )
+
+
+def cart_line(name, unit, amount):
+    return {'name': name, 'measurement_unit': unit, 'total_amount': amount}
+
+
+class UnitsTest(SimpleTestCase):
+    """
+    Приведение и сложение единиц в списке покупок.
+    """
+
+    def test_normalize_unit(self):
+        for unit, expected in (('гр.', 'г'), (' Кг ', 'кг'),
+                               ('ст.л.', 'ст. л.'), ('ст.  Л.', 'ст. л.'),
+                               ('щепотка', 'щепотка')):
+            self.assertEqual(normalize_unit(unit), expected, unit)
+
+    def test_smallest_unit(self):
+        self.assertEqual(fold_units([
+            cart_line('мука', 'кг', 1),
+            cart_line('мука', 'гр', 250),
+            cart_line('вода', 'ст. л.', 1),
+            cart_line('вода', 'ч.л.', 1),
+        ]), [
+            cart_line('мука', 'гр', 1250),
+            cart_line('вода', 'ч.л.', 4),
+        ])
+
+    def test_base_unit_fallback(self):
+        self.assertEqual(fold_units([
+            cart_line('молоко', 'л', 1),
+            cart_line('молоко', 'ст. л.', 1),
+        ]), [cart_line('молоко', 'мл', 1015)])
+        self.assertEqual(fold_units([
+            cart_line('молоко', 'ст. л.', 2),
+            cart_line('молоко', 'л', 1),
+        ]), [cart_line('молоко', 'мл', 1030)])
+
+    def test_unknown_units(self):
+        self.assertEqual(fold_units([
+            cart_line('соль', 'щепотка', 1),
+            cart_line('соль', 'г', 5),
+            cart_line('соль', 'Щепотка', 2),
+            cart_line('яйца', 'шт.', 3),
+        ]), [
+            cart_line('соль', 'щепотка', 3),
+            cart_line('соль', 'г', 5),
+            cart_line('яйца', 'шт.', 3),
+        ])
+
+
+class AdminCartTest(TestCase):
+    """
+    Правка ингредиентов рецептов в админке обновляет списки покупок.
+    """
+
+    def setUp(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass',
+            first_name='Админ', last_name='Тестовый'
+        )
+        self.client.force_login(admin)
+        self.salt, self.sugar = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар')
+        ]
+        self.recipes = [
+            Recipe.objects.create(
+                author=admin, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/images/test.png'
+            ) for number in range(2)
+        ]
+        self.row = IngredientRecipe.objects.create(
+            recipe=self.recipes[0], ingredient=self.salt, amount=5
+        )
+        ShoppingCart.objects.create(user=admin, recipe=self.recipes[0])
+
+    def assert_totals_consistent(self):
+        self.assertEqual(carts.get_stored_totals(), carts.get_live_totals())
+
+    def test_change(self):
+        url = f'/admin/recipes/ingredientrecipe/{self.row.pk}/change/'
+        response = self.client.post(url, {
+            'recipe': self.recipes[0].pk,
+            'ingredient': self.sugar.pk,
+            'amount': 7,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assert_totals_consistent()
+        self.client.post(url, {
+            'recipe': self.recipes[1].pk,
+            'ingredient': self.sugar.pk,
+            'amount': 7,
+        })
+        self.assert_totals_consistent()
+
+    def test_add_and_delete(self):
+        self.client.post('/admin/recipes/ingredientrecipe/add/', {
+            'recipe': self.recipes[0].pk,
+            'ingredient': self.sugar.pk,
+            'amount': 3,
+        })
+        self.assert_totals_consistent()
+        self.client.post(
+            f'/admin/recipes/ingredientrecipe/{self.row.pk}/delete/',
+            {'post': 'yes'}
+        )
+        self.assert_totals_consistent()
+        self.client.post('/admin/recipes/ingredientrecipe/', {
+            'action': 'delete_selected',
+            'post': 'yes',
+            '_selected_action': list(IngredientRecipe.objects.values_list(
+                'pk', flat=True
+            )),
+        })
+        self.assertFalse(IngredientRecipe.objects.exists())
+        self.assert_totals_consistent()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageVariantsTest(TestCase):
+    """
+    Файлы вариантов удаленной или замененной картинки удаляются,
+    если на них не ссылаются другие рецепты.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass',
+            first_name='Автор', last_name='Тестовый'
+        )
+
+    def create_recipe(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), color).save(buffer, format='PNG')
+        recipe = Recipe(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10
+        )
+        recipe.image.save('test.png', ContentFile(buffer.getvalue()))
+        return recipe
+
+    def build(self, recipe):
+        images.build_variants(recipe.pk)
+        recipe.refresh_from_db()
+        return images.variant_names(recipe.image_variants)
+
+    def assert_exist(self, names, exist=True):
+        for name in names:
+            self.assertEqual(default_storage.exists(name), exist, name)
+
+    def test_delete_shared(self):
+        first = self.create_recipe('red')
+        second = self.create_recipe('red')
+        names = self.build(first)
+        self.assertEqual(self.build(second), names)
+        self.assertEqual(len(names), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assert_exist(names)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assert_exist(names, exist=False)
+
+    def test_image_replaced_while_building(self):
+        recipe = self.create_recipe('blue')
+        render_variants = images.render_variants
+        names = set()
+
+        def render_and_replace(file):
+            variants = render_variants(file)
+            names.update(images.variant_names(variants))
+            self.assert_exist(names)
+            Recipe.objects.filter(pk=recipe.pk).update(image='other.png')
+            return variants
+
+        with mock.patch.object(
+            images, 'render_variants', side_effect=render_and_replace
+        ), self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(images.build_variants(recipe.pk))
+        self.assertEqual(len(names), 4)
+        self.assert_exist(names, exist=False)
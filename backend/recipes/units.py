@@ -0,0 +1,77 @@
+# Единица -> (величина, множитель к наименьшей единице величины).
+# Множители целые, поэтому суммирование идет без потерь точности.
+UNITS = {
+    'мг': ('mass', 1),
+    'г': ('mass', 1000),
+    'кг': ('mass', 1000 * 1000),
+    'мл': ('volume', 1),
+    'ч. л.': ('volume', 5),
+    'ст. л.': ('volume', 15),
+    'л': ('volume', 1000),
+}
+# Единица, в которой выражается сумма, если она не делится нацело
+# на наименьшую из встретившихся единиц: 1 л + 1 ст. л. = 1015 мл.
+BASE_UNITS = {
+    'mass': 'г',
+    'volume': 'мл',
+}
+UNIT_ALIASES = {
+    'гр': 'г',
+    'гр.': 'г',
+    'г.': 'г',
+    'кг.': 'кг',
+    'мл.': 'мл',
+    'л.': 'л',
+    'ч.л.': 'ч. л.',
+    'ст.л.': 'ст. л.',
+}
+
+
+def normalize_unit(unit):
+    unit = ' '.join(unit.split()).casefold()
+    return UNIT_ALIASES.get(unit, unit)
+
+
+def format_amount(total, factor):
+    amount, remainder = divmod(total, factor)
+    if remainder:
+        return round(total / factor, 3)
+    return amount
+
+
+def fold_units(cart):
+    """
+    Складывает строки списка покупок с одинаковым названием
+    и совместимыми единицами (г и кг, мл и ст. л. ...) за один проход.
+    Итог выражается в наименьшей из встретившихся единиц, а если
+    сумма в ней не целая - в базовой единице величины (г, мл);
+    строки с неизвестными единицами складываются только с той же
+    единицей.
+    Порядок - порядок первого появления, поэтому отсортированный
+    по названию вход дает отсортированный выход.
+    """
+    groups = {}
+    for item in cart:
+        unit = normalize_unit(item['measurement_unit'])
+        dimension, factor = UNITS.get(unit, (unit, 1))
+        key = (item['name'], dimension)
+        amount = item['total_amount'] * factor
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [amount, factor, item['measurement_unit']]
+            continue
+        group[0] += amount
+        if factor < group[1]:
+            group[1] = factor
+            group[2] = item['measurement_unit']
+    folded = []
+    for (name, dimension), (total, factor, unit) in groups.items():
+        if total % factor and dimension in BASE_UNITS:
+            unit = BASE_UNITS[dimension]
+            factor = UNITS[unit][1]
+        folded.append({
+            'name': name,
+            'measurement_unit': unit,
+            'total_amount': format_amount(total, factor),
+        })
+    return folded
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.14 on 2026-10-18 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20230118_0934'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['user', 'id'], name='follow_user_id_idx'),
+        ),
+    ]
@@ -84,6 +84,9 @@ class Follow(models.Model):
                 name='unique_user_author'
             )
         ]
+        indexes = [
+            models.Index(fields=['user', 'id'], name='follow_user_id_idx')
+        ]
 
     def __str__(self):
         return f'Пользователь: {self.user} подписан на {self.author}.'